@@ -1,11 +1,291 @@
 import requests
 import json
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from requests.adapters import HTTPAdapter
 from config import Config
+from movie_catalog import MovieCatalog, tokenize
+
+def _build_http_session():
+    """One Session for every upstream API: per-host keep-alive connection pools"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=Config.HTTP_POOL_HOSTS, pool_maxsize=Config.HTTP_POOL_SIZE)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+http_session = _build_http_session()
+HTTP_TIMEOUT = (Config.HTTP_CONNECT_TIMEOUT, Config.HTTP_READ_TIMEOUT)
+
+def http_get(url, params=None):
+    """GET through the shared session; a hung upstream fails after the timeouts"""
+    return http_session.get(url, params=params, timeout=HTTP_TIMEOUT)
+
+class _InFlight:
+    """An upstream call that concurrent identical lookups wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+class ResponseCache:
+    """Bounded LRU cache with a TTL and single-flight loading.
+
+    get_or_load() returns a fresh cached value when there is one. Otherwise
+    the first caller for a key runs the loader while identical concurrent
+    calls wait for its result instead of calling upstream themselves.
+    Loader exceptions are passed to every waiter and nothing is cached.
+
+    ttl is a number of seconds or a callable returning one, evaluated when
+    a value is stored. With stale_grace > 0 an expired value is still
+    served for that many seconds while a background thread refreshes it.
+    """
+
+    def __init__(self, max_size, ttl, stale_grace=0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.stale_grace = stale_grace
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.coalesced = self.evictions = self.expirations = 0
+        self.stale_hits = self.refresh_errors = 0
+
+    def get_or_load(self, key, loader):
+        with self._lock:
+            now = time.monotonic()
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, fresh_until, stale_until = entry
+                if fresh_until > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                if stale_until > now:
+                    self._entries.move_to_end(key)
+                    self.stale_hits += 1
+                    if key not in self._inflight:
+                        call = self._inflight[key] = _InFlight()
+                        threading.Thread(target=self._refresh, args=(key, loader, call),
+                                         name='response-cache-refresh', daemon=True).start()
+                    return value
+                # Kept (not deleted) so peek() can still serve it if the reload fails
+                self.expirations += 1
+
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self._inflight[key] = _InFlight()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        return self._load(key, loader, call)
+
+    def _load(self, key, loader, call):
+        try:
+            call.value = loader()
+        except Exception as e:
+            call.error = e
+            raise
+        else:
+            ttl = self.ttl() if callable(self.ttl) else self.ttl
+            with self._lock:
+                fresh_until = time.monotonic() + ttl
+                self._entries[key] = (call.value, fresh_until, fresh_until + self.stale_grace)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+            return call.value
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            call.done.set()
+
+    def _refresh(self, key, loader, call):
+        try:
+            self._load(key, loader, call)
+        except Exception as e:
+            # Keep serving the stale value until its grace period runs out
+            with self._lock:
+                self.refresh_errors += 1
+            print(f"Error refreshing cached response: {e}")
+
+    def peek(self, key):
+        """Last value stored for key, however old (None if never loaded or evicted)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry[0] if entry is not None else None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl() if callable(self.ttl) else self.ttl,
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'refresh_errors': self.refresh_errors
+            }
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose breaker is open"""
+
+class RequestRejected(Exception):
+    """The provider answered but refused this request (bad input, key); not an outage"""
+
+def check_http_status(response, provider):
+    """Raise for error responses: 5xx and 429 mean the provider is unwell, other 4xx that the request was refused"""
+    if response.status_code >= 500 or response.status_code == 429:
+        raise RuntimeError(f"{provider} HTTP {response.status_code}")
+    if response.status_code >= 400:
+        raise RequestRejected(f"{provider} HTTP {response.status_code}")
+
+class CircuitBreaker:
+    """Stops calling a provider that keeps failing.
+
+    closed: calls go through and their outcomes are kept for `window`
+    seconds. Once there are at least `min_calls` outcomes and the share of
+    failures reaches `failure_rate`, the breaker opens.
+
+    open: calls fail at once with CircuitOpenError for the cool-down.
+
+    half_open: after the cool-down a single probe call is let through
+    (others keep failing fast). Success closes the breaker. Failure
+    reopens it with the cool-down doubled, up to max_open_seconds.
+
+    RequestRejected is passed to the caller but counts as a success: the
+    provider is up, it just refused what the user asked for.
+    """
+
+    def __init__(self, name, window=None, min_calls=None, failure_rate=None,
+                 open_seconds=None, max_open_seconds=None):
+        self.name = name
+        self.window = window or Config.BREAKER_WINDOW
+        self.min_calls = min_calls or Config.BREAKER_MIN_CALLS
+        self.failure_rate = failure_rate or Config.BREAKER_FAILURE_RATE
+        self.open_seconds = open_seconds or Config.BREAKER_OPEN_SECONDS
+        self.max_open_seconds = max_open_seconds or Config.BREAKER_MAX_OPEN_SECONDS
+        self.state = 'closed'
+        self.cooldown = self.open_seconds
+        self.opened_until = 0
+        self._outcomes = deque()  # (monotonic time, succeeded)
+        self._probing = False
+        self._lock = threading.Lock()
+        self.rejected = self.trips = 0
+
+    def _prune(self, now):
+        while self._outcomes and self._outcomes[0][0] < now - self.window:
+            self._outcomes.popleft()
+
+    def _before_call(self):
+        with self._lock:
+            if self.state == 'open':
+                if time.monotonic() < self.opened_until:
+                    self.rejected += 1
+                    raise CircuitOpenError(f"{self.name} circuit is open")
+                self.state = 'half_open'
+            if self.state == 'half_open':
+                if self._probing:
+                    self.rejected += 1
+                    raise CircuitOpenError(f"{self.name} circuit is half-open")
+                self._probing = True
+                return True
+            return False
+
+    def _open(self, now):
+        self.state = 'open'
+        self.opened_until = now + self.cooldown
+        self._outcomes.clear()
+        self.trips += 1
+
+    def _record(self, probe, succeeded):
+        with self._lock:
+            now = time.monotonic()
+            if probe:
+                self._probing = False
+                if succeeded:
+                    self.state = 'closed'
+                    self.cooldown = self.open_seconds
+                else:
+                    # Still down: wait longer before the next probe
+                    self.cooldown = min(self.cooldown * 2, self.max_open_seconds)
+                    self._open(now)
+                return
+            if self.state != 'closed':
+                return
+            self._outcomes.append((now, succeeded))
+            self._prune(now)
+            failures = sum(1 for _, ok in self._outcomes if not ok)
+            if len(self._outcomes) >= self.min_calls and failures >= self.failure_rate * len(self._outcomes):
+                self._open(now)
+
+    def call(self, function, *args):
+        probe = self._before_call()
+        try:
+            result = function(*args)
+        except RequestRejected:
+            self._record(probe, True)
+            raise
+        except Exception:
+            self._record(probe, False)
+            raise
+        self._record(probe, True)
+        return result
+
+    def stats(self):
+        with self._lock:
+            now = time.monotonic()
+            self._prune(now)
+            return {
+                'state': self.state,
+                'recent_calls': len(self._outcomes),
+                'recent_failures': sum(1 for _, ok in self._outcomes if not ok),
+                'cooldown': self.cooldown,
+                'retry_in': round(max(0, self.opened_until - now), 1) if self.state == 'open' else 0,
+                'trips': self.trips,
+                'rejected': self.rejected
+            }
 
 class GooglePlacesService:
+    BASE_URL = "https://maps.googleapis.com/maps/api/place/textsearch/json"
+    cache = ResponseCache(Config.PLACES_CACHE_SIZE, Config.PLACES_CACHE_TTL)
+    breaker = CircuitBreaker('places')
+
     @staticmethod
-    def search_places(query, location=None, radius=5000):
-        base_url = "https://maps.googleapis.com/maps/api/place/textsearch/json"
+    def cache_key(query, location=None, radius=5000):
+        """Normalize a search so equivalent requests share one cache entry"""
+        query = ' '.join((query or '').lower().split())
+        if not location:
+            return (query, None, None)
+        try:
+            # ~11 m precision: nearby map positions reuse the same results
+            lat, lng = (round(float(part), 4) for part in str(location).split(','))
+            location = f"{lat},{lng}"
+        except ValueError:
+            location = str(location).replace(' ', '')
+        return (query, location, int(radius))
+
+    @staticmethod
+    def _fetch_places(query, location, radius):
         params = {
             'query': query,
             'key': Config.GOOGLE_PLACES_API_KEY
@@ -14,61 +294,117 @@ class GooglePlacesService:
         if location:
             params['location'] = location
             params['radius'] = radius
-            
-        try:
-            response = requests.get(base_url, params=params)
-            data = response.json()
-            
-            if data['status'] == 'OK':
-                places = []
-                for place in data['results']:
-                    places.append({
-                        'id': place['place_id'],
-                        'name': place['name'],
-                        'address': place.get('formatted_address', ''),
-                        'rating': place.get('rating'),
-                        'price_level': place.get('price_level'),
-                        'types': place.get('types', []),
-                        'location': place['geometry']['location']
-                    })
-                return places
+        
+        response = http_get(GooglePlacesService.BASE_URL, params=params)
+        check_http_status(response, 'Places API')
+        data = response.json()
+        
+        if data['status'] == 'ZERO_RESULTS':
             return []
+        # None of these may be cached as an empty result; only the first two mean Places is unwell
+        if data['status'] in ('OVER_QUERY_LIMIT', 'UNKNOWN_ERROR'):
+            raise RuntimeError(f"Places API status {data['status']}")
+        if data['status'] != 'OK':
+            # INVALID_REQUEST, REQUEST_DENIED: this search was refused, the service is fine
+            raise RequestRejected(f"Places API status {data['status']}")
+        
+        places = []
+        for place in data['results']:
+            places.append({
+                'id': place['place_id'],
+                'name': place['name'],
+                'address': place.get('formatted_address', ''),
+                'rating': place.get('rating'),
+                'price_level': place.get('price_level'),
+                'types': place.get('types', []),
+                'location': place['geometry']['location']
+            })
+        return places
+
+    @staticmethod
+    def search_places(query, location=None, radius=5000):
+        key = GooglePlacesService.cache_key(query, location, radius)
+        try:
+            return GooglePlacesService.cache.get_or_load(
+                key, lambda: GooglePlacesService.breaker.call(GooglePlacesService._fetch_places, query, location, radius))
+        except CircuitOpenError:
+            return GooglePlacesService.cache.peek(key) or []
         except Exception as e:
             print(f"Error fetching places: {e}")
-            return []
+            # Last known good results rather than nothing
+            return GooglePlacesService.cache.peek(key) or []
 
 class TMDBService:
+    BASE_URL = "https://api.themoviedb.org/3/search/movie"
+    catalog = MovieCatalog(Config.MOVIE_CATALOG_PATH)
+    breaker = CircuitBreaker('movies')
+    # Normalized queries already sent to TMDB; their results are in the catalog
+    _searched = set()
+
     @staticmethod
-    def search_movies(query):
-        base_url = "https://api.themoviedb.org/3/search/movie"
+    def _fetch_movies(query):
         params = {
             'api_key': Config.TMDB_API_KEY,
             'query': query
         }
         
+        response = http_get(TMDBService.BASE_URL, params=params)
+        data = response.json()
+        
+        movies = []
+        for movie in data.get('results', []):
+            movies.append({
+                'id': movie['id'],
+                'title': movie['title'],
+                'overview': movie.get('overview', ''),
+                'release_date': movie.get('release_date', ''),
+                'rating': movie.get('vote_average', 0),
+                'poster_path': f"https://image.tmdb.org/t/p/w500{movie.get('poster_path', '')}" if movie.get('poster_path') else None
+            })
+        return movies
+
+    @staticmethod
+    def search_movies(query, limit=10):
+        # Served locally when the catalog already has a full page or this query was fetched before
+        normalized = ' '.join(tokenize(query))
+        local = TMDBService.catalog.search(normalized, limit)
+        if len(local) >= limit or normalized in TMDBService._searched:
+            return local
+        
         try:
-            response = requests.get(base_url, params=params)
-            data = response.json()
-            
-            movies = []
-            for movie in data.get('results', [])[:10]:
-                movies.append({
-                    'id': movie['id'],
-                    'title': movie['title'],
-                    'overview': movie.get('overview', ''),
-                    'release_date': movie.get('release_date', ''),
-                    'rating': movie.get('vote_average', 0),
-                    'poster_path': f"https://image.tmdb.org/t/p/w500{movie.get('poster_path', '')}" if movie.get('poster_path') else None
-                })
-            return movies
+            movies = TMDBService.breaker.call(TMDBService._fetch_movies, query)
+            # Index the whole page, not just the results returned here
+            TMDBService.catalog.add_many(movies)
+            if len(TMDBService._searched) > 10000:
+                TMDBService._searched.clear()
+            TMDBService._searched.add(normalized)
+            return movies[:limit]
+        except CircuitOpenError:
+            return local
         except Exception as e:
             print(f"Error fetching movies: {e}")
-            return []
+            return local
+
+def seconds_to_next_forecast_slot(slot_hours=3):
+    """Seconds until the next UTC boundary of the provider's 3-hour forecast steps"""
+    slot = slot_hours * 3600
+    return slot - time.time() % slot
 
 class OpenWeatherService:
+    BASE_URL = "https://api.openweathermap.org/data/2.5/forecast"
+    cache = ResponseCache(Config.WEATHER_CACHE_SIZE, seconds_to_next_forecast_slot,
+                          stale_grace=Config.WEATHER_STALE_GRACE)
+    breaker = CircuitBreaker('weather')
+
     @staticmethod
-    def get_weather_forecast(lat, lon):
-        base_url = "https://api.openweathermap.org/data/2.5/forecast"
+    def grid_cell(lat, lon):
+        """Snap a position to the centre of its WEATHER_GRID_DEGREES cell"""
+        step = Config.WEATHER_GRID_DEGREES
+        return (round(round(float(lat) / step) * step, 6),
+                round(round(float(lon) / step) * step, 6))
+
+    @staticmethod
+    def _fetch_forecast(lat, lon):
         params = {
             'lat': lat,
             'lon': lon,
@@ -76,19 +412,64 @@ class OpenWeatherService:
             'units': 'metric'
         }
         
+        response = http_get(OpenWeatherService.BASE_URL, params=params)
+        # A 400 for lat=999 is the caller's fault and must not trip the breaker for everyone
+        check_http_status(response, 'Forecast API')
+        data = response.json()
+        if 'list' not in data:
+            # Error payload on a 200: don't cache it as "no forecast"
+            raise RuntimeError(f"Forecast API error: {data.get('message', data)}")
+        
+        forecast = []
+        for item in data['list'][:8]:
+            forecast.append({
+                'datetime': item['dt_txt'],
+                'temp': item['main']['temp'],
+                'description': item['weather'][0]['description'],
+                'icon': item['weather'][0]['icon']
+            })
+        return forecast
+
+    @staticmethod
+    def get_weather_forecast(lat, lon):
         try:
-            response = requests.get(base_url, params=params)
-            data = response.json()
-            
-            forecast = []
-            for item in data.get('list', [])[:8]:
-                forecast.append({
-                    'datetime': item['dt_txt'],
-                    'temp': item['main']['temp'],
-                    'description': item['weather'][0]['description'],
-                    'icon': item['weather'][0]['icon']
-                })
-            return forecast
-        except Exception as e:
+            # Every position in a cell shares the forecast fetched for its centre
+            cell = OpenWeatherService.grid_cell(lat, lon)
+        except (TypeError, ValueError) as e:
             print(f"Error fetching weather: {e}")
             return []
+        try:
+            return OpenWeatherService.cache.get_or_load(
+                cell, lambda: OpenWeatherService.breaker.call(OpenWeatherService._fetch_forecast, *cell))
+        except CircuitOpenError:
+            return OpenWeatherService.cache.peek(cell) or []
+        except Exception as e:
+            print(f"Error fetching weather: {e}")
+            return OpenWeatherService.cache.peek(cell) or []
+
+# Shared by every suggestions request; a call that misses its deadline keeps
+# running here and still fills the provider's cache for the next request
+suggestion_executor = ThreadPoolExecutor(max_workers=Config.SUGGESTION_WORKERS, thread_name_prefix='suggestions')
+
+def fetch_suggestions(calls):
+    """Run provider calls concurrently and collect what finishes in time.
+
+    calls maps a name to (function, args, deadline_seconds). Returns
+    (results, timed_out): results has a value for every name (an empty list
+    when the provider missed its deadline), timed_out lists those names.
+    """
+    started = time.monotonic()
+    futures = {name: (suggestion_executor.submit(function, *args), deadline)
+               for name, (function, args, deadline) in calls.items()}
+
+    results, timed_out = {}, []
+    for name, (future, deadline) in futures.items():
+        try:
+            results[name] = future.result(timeout=max(0, started + deadline - time.monotonic()))
+        except FutureTimeout:
+            results[name] = []
+            timed_out.append(name)
+        except Exception as e:
+            print(f"Error fetching {name} suggestions: {e}")
+            results[name] = []
+    return results, timed_out
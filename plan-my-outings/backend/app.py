@@ -2,18 +2,30 @@ from flask import Flask, request, jsonify
 from flask_cors import CORS
 from flask_mail import Mail, Message
 from database import db, User, Group, Event, Enquiry, Poll, EventOption, Vote, GroupMember, create_user_from_enquiry
-from auth import token_required, generate_token
-from api_services import GooglePlacesService, TMDBService, OpenWeatherService
-from socket_events import socketio
+from database import Ballot, ensure_group_counter_columns, ensure_indexes, ensure_ballots, configure_sqlite
+from auth import token_required, generate_token, invalidate_user, clear_user_cache
+from api_services import GooglePlacesService, TMDBService, OpenWeatherService, fetch_suggestions
+from socket_events import socketio, vote_broadcaster, presence_broadcaster
+from socket_registry import connection_registry
+from group_chat import ChatMessage, chat_writer, load_history
+from room_replay import room_replay
 from config import Config
-from email_tracking import EmailLog, EmailTracker
+from email_tracking import EmailLog, EmailTracker, EmailStatsHourly, ensure_hourly_stats
+from mail_queue import OutboundEmail, enqueue_email, mail_queue, clear_finished_bodies
+from smtp_pool import SMTPPool
+from vote_tally import vote_tally
+from poll_results import poll_results, poll_is_closed
+from sqlalchemy.exc import IntegrityError
 import json
+import os
+import time
 
 app = Flask(__name__)
 app.config.from_object(Config)
 
 # Initialize extensions
 db.init_app(app)
+configure_sqlite(app)
 CORS(app, resources={
     r"/api/*": {"origins": ["http://localhost:3000"]},
     r"/contact": {"origins": ["http://localhost:3000"]},
@@ -22,7 +34,14 @@ CORS(app, resources={
     r"/events": {"origins": ["http://localhost:3000"]}
 })
 socketio.init_app(app)
+if Config.SOCKETIO_MESSAGE_QUEUE:
+    # Replay and presence are shared through the app database; vote and presence
+    # broadcasts run in background tasks without an app context, so they get the engine
+    with app.app_context():
+        room_replay.bind(db.engine)
+        presence_broadcaster.shared.bind(db.engine)
 mail = Mail(app)
+smtp_pool = SMTPPool(mail, Config.SMTP_POOL_SIZE, Config.SMTP_POOL_MAX_IDLE)
 
 # Home route is now handled by serve_frontend function
 
@@ -69,13 +88,7 @@ def groups_options():
 def groups_redirect(current_user):
     if request.method == 'GET':
         # Get groups for current user
-        groups = Group.query.filter(Group.members.any(user_id=current_user.id)).all()
-        return jsonify([{
-            'id': group.id,
-            'name': group.name,
-            'description': group.description,
-            'member_count': len(group.members)
-        } for group in groups])
+        return jsonify(list_user_groups(current_user.id))
     else:  # POST
         # Create group for current user
         data = request.get_json()
@@ -186,19 +199,13 @@ def contact_enquiry():
         # Create user automatically
         user, password = create_user_from_enquiry(data)
         db.session.add(user)
-        db.session.commit()
+        db.session.flush()
         
-        # Send email with credentials and admin notification
-        if app.config.get('MAIL_USERNAME') and app.config.get('MAIL_PASSWORD'):
-            # Send credentials to user
-            user_subject = '🎉 Welcome to Plan My Outings - Account Created!'
-            try:
-                user_msg = Message(
-                    subject=user_subject,
-                    sender=app.config['MAIL_USERNAME'],
-                    recipients=[user.email]
-                )
-                user_msg.body = f"""
+        # Queue email with credentials and admin notification; mail_queue sends them after commit
+        queued = bool(app.config.get('MAIL_USERNAME') and app.config.get('MAIL_PASSWORD'))
+        if queued:
+            # Credentials for the user
+            user_body = f"""
 🎉 Welcome to Plan My Outings, {user.first_name}!
 ============================================
 
@@ -249,25 +256,10 @@ The Plan My Outings Team
 This email was sent to {user.email}
 If you didn't create this account, please ignore this email.
                 """
-                mail.send(user_msg)
-                # Log successful email
-                EmailTracker.log_email_sent(user.email, user_subject, 'welcome', user.id)
-                
-            except Exception as e:
-                # Log failed email
-                EmailTracker.log_email_failed(user.email, user_subject, 'welcome', str(e), user.id)
-                import logging
-                logging.error(f"User email sending failed: {str(e)}")
+            enqueue_email(user.email, '🎉 Welcome to Plan My Outings - Account Created!', user_body, 'welcome', user.id)
             
-            # Send notification to admin
-            admin_subject = 'New User Registration - Plan My Outings'
-            try:
-                admin_msg = Message(
-                    subject=admin_subject,
-                    sender=app.config['MAIL_USERNAME'],
-                    recipients=[app.config['SUPER_ADMIN_EMAIL'] or app.config['MAIL_USERNAME']]
-                )
-                admin_msg.body = f"""
+            # Notification to admin
+            admin_body = f"""
 New User Registration Alert
 
 User Details:
@@ -278,19 +270,13 @@ User Details:
 - Registration Time: {user.created_at}
 - Message: {enquiry.message or 'No message provided'}
 
-Total Users: {User.query.count()}
-
 Admin Dashboard: http://localhost:3000/admin
                 """
-                mail.send(admin_msg)
-                # Log successful admin email
-                EmailTracker.log_email_sent(app.config['SUPER_ADMIN_EMAIL'], admin_subject, 'admin_notification')
-                
-            except Exception as e:
-                # Log failed admin email
-                EmailTracker.log_email_failed(app.config['SUPER_ADMIN_EMAIL'], admin_subject, 'admin_notification', str(e))
-                import logging
-                logging.error(f"Admin email sending failed: {str(e)}")
+            enqueue_email(app.config['SUPER_ADMIN_EMAIL'] or app.config['MAIL_USERNAME'],
+                          'New User Registration - Plan My Outings', admin_body, 'admin_notification')
+        db.session.commit()
+        if queued:
+            mail_queue.wake()
         
         return jsonify({
             'message': 'Enquiry submitted!',
@@ -308,16 +294,25 @@ Admin Dashboard: http://localhost:3000/admin
         return jsonify({'message': f'Error: {str(e)}'}), 500
 
 # Group management
+def list_user_groups(user_id):
+    """Groups a user belongs to, with member counts, in a single query"""
+    rows = (
+        db.session.query(Group.id, Group.name, Group.description, Group.member_count)
+        .filter(Group.members.any(user_id=user_id))
+        .order_by(Group.id)
+        .all()
+    )
+    return [{
+        'id': group_id,
+        'name': name,
+        'description': description,
+        'member_count': count
+    } for group_id, name, description, count in rows]
+
 @app.route('/api/groups', methods=['GET'])
 @token_required
 def get_groups(current_user):
-    groups = Group.query.filter(Group.members.any(user_id=current_user.id)).all()
-    return jsonify([{
-        'id': group.id,
-        'name': group.name,
-        'description': group.description,
-        'member_count': len(group.members)
-    } for group in groups])
+    return jsonify(list_user_groups(current_user.id))
 
 @app.route('/api/groups', methods=['POST'])
 @token_required
@@ -342,6 +337,36 @@ def create_group(current_user):
     
     return jsonify({'message': 'Group created successfully', 'group_id': group.id})
 
+@app.route('/api/groups/<int:group_id>/presence', methods=['GET'])
+@token_required
+def get_group_presence(current_user, group_id):
+    """Members with an open socket in the group room, from the registry (and other workers' rows behind a queue)"""
+    if current_user.username != 'superadmin' and not GroupMember.query.filter_by(group_id=group_id, user_id=current_user.id).first():
+        return jsonify({'message': 'Not a member of this group'}), 403
+    online = presence_broadcaster.online(f'group_{group_id}')
+    return jsonify({
+        'group_id': group_id,
+        'online': online,
+        'online_count': len(online)
+    })
+
+@app.route('/api/groups/<int:group_id>/messages', methods=['GET'])
+@token_required
+def get_group_messages(current_user, group_id):
+    """A page of chat history: ?before_id= pages back from the newest, ?since= catches up after a reconnect"""
+    if current_user.username != 'superadmin' and not GroupMember.query.filter_by(group_id=group_id, user_id=current_user.id).first():
+        return jsonify({'message': 'Not a member of this group'}), 403
+    limit = min(max(request.args.get('limit', 50, type=int), 1), Config.CHAT_HISTORY_MAX_LIMIT)
+    messages, has_more = load_history(group_id,
+                                      before_id=request.args.get('before_id', type=int),
+                                      since_id=request.args.get('since', type=int),
+                                      limit=limit)
+    return jsonify({
+        'group_id': group_id,
+        'messages': messages,
+        'has_more': has_more
+    })
+
 # Event management
 @app.route('/api/events', methods=['POST'])
 @token_required
@@ -382,6 +407,37 @@ def get_weather(current_user):
     weather = OpenWeatherService.get_weather_forecast(lat, lon)
     return jsonify(weather)
 
+@app.route('/api/events/<int:event_id>/suggestions', methods=['GET'])
+@token_required
+def get_event_suggestions(current_user, event_id):
+    """Places, movies and weather for an event in one call, fetched in parallel"""
+    event = Event.query.get_or_404(event_id)
+    if current_user.username != 'superadmin' and not GroupMember.query.filter_by(group_id=event.group_id, user_id=current_user.id).first():
+        return jsonify({'message': 'Not a member of this group'}), 403
+    
+    query = request.args.get('query') or event.title
+    lat = request.args.get('lat')
+    lon = request.args.get('lon')
+    location = request.args.get('location') or (f"{lat},{lon}" if lat and lon else None)
+    
+    calls = {
+        'places': (GooglePlacesService.search_places, (query, location), Config.PLACES_DEADLINE),
+        'movies': (TMDBService.search_movies, (request.args.get('movie_query') or query,), Config.MOVIES_DEADLINE)
+    }
+    if lat and lon:
+        calls['weather'] = (OpenWeatherService.get_weather_forecast, (lat, lon), Config.WEATHER_DEADLINE)
+    
+    started = time.monotonic()
+    results, timed_out = fetch_suggestions(calls)
+    return jsonify({
+        'event_id': event.id,
+        'places': results['places'],
+        'movies': results['movies'],
+        'weather': results.get('weather', []),
+        'timed_out': timed_out,
+        'elapsed_ms': round((time.monotonic() - started) * 1000)
+    })
+
 # Poll and voting
 @app.route('/api/polls/<int:poll_id>/vote', methods=['POST'])
 @token_required
@@ -389,16 +445,151 @@ def cast_vote(current_user, poll_id):
     data = request.get_json()
     option_id = data.get('option_id')
     
+    if poll_is_closed(poll_id):
+        return jsonify({'message': 'This poll is closed'}), 400
+    
     # Check if user already voted (for single choice polls)
     existing_vote = Vote.query.filter_by(poll_id=poll_id, user_id=current_user.id).first()
     if existing_vote:
         return jsonify({'message': 'You have already voted!'}), 400
     
     vote = Vote(poll_id=poll_id, option_id=option_id, user_id=current_user.id)
-    db.session.add(vote)
+    db.session.add_all([Ballot(poll_id=poll_id, user_id=current_user.id), vote])
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another ballot from this user committed after the check above (uq_ballot_poll_user)
+        db.session.rollback()
+        return jsonify({'message': 'You have already voted!'}), 400
+    
+    vote_count = vote_tally.record(vote)
+    vote_broadcaster.mark(poll_id)
+    return jsonify({'message': 'Vote cast successfully!', 'vote_count': vote_count})
+
+def parse_ballot(poll, data):
+    """Validate a ballot against the poll type; returns [(option_id, vote_value)].
+
+    Accepted bodies: {"option_ids": [...]} (for ranked polls the order is
+    the ranking), {"ranking": [...]}, or {"votes": [{"option_id", "value"}]}
+    where value is the rank on ranked polls. Raises ValueError with a
+    message for the client.
+    """
+    poll_type = poll.poll_type or 'multiple'
+    if data.get('votes') is not None:
+        entries = [(int(vote['option_id']), int(vote['value']) if vote.get('value') is not None else None)
+                   for vote in data['votes']]
+    else:
+        option_ids = data.get('ranking') if data.get('ranking') is not None else data.get('option_ids')
+        if option_ids is None and data.get('option_id') is not None:
+            option_ids = [data['option_id']]
+        entries = [(int(option_id), None) for option_id in option_ids or []]
+
+    if not entries:
+        raise ValueError('A ballot needs at least one option')
+    option_ids = [option_id for option_id, _ in entries]
+    if len(set(option_ids)) != len(option_ids):
+        raise ValueError('Each option can appear only once on a ballot')
+    if poll_type == 'single' and len(entries) != 1:
+        raise ValueError('This poll accepts exactly one option')
+
+    if poll_type == 'ranked':
+        ranks = [value if value is not None else position for position, (_, value) in enumerate(entries, 1)]
+        if sorted(ranks) != list(range(1, len(ranks) + 1)):
+            raise ValueError('Ranks must be 1..n without gaps or ties')
+        entries = [(option_id, rank) for (option_id, _), rank in zip(entries, ranks)]
+    else:
+        entries = [(option_id, 1) for option_id, _ in entries]
+
+    valid = {option_id for (option_id,) in db.session.query(EventOption.id)
+             .filter(EventOption.event_id == poll.event_id, EventOption.id.in_(option_ids))}
+    if len(valid) != len(option_ids):
+        raise ValueError('Ballot contains options that are not part of this poll')
+    return entries
+
+@app.route('/api/polls/<int:poll_id>/ballot', methods=['POST'])
+@token_required
+def submit_ballot(current_user, poll_id):
+    """A user's whole ballot in one request, written with one bulk insert"""
+    poll = Poll.query.get_or_404(poll_id)
+    if poll_is_closed(poll.id):
+        return jsonify({'message': 'This poll is closed'}), 400
+    try:
+        entries = parse_ballot(poll, request.get_json() or {})
+    except (ValueError, TypeError, KeyError, AttributeError) as e:
+        return jsonify({'message': f'Invalid ballot: {e}'}), 400
+    
+    if Vote.query.filter_by(poll_id=poll.id, user_id=current_user.id).first():
+        return jsonify({'message': 'You have already voted!'}), 400
+    
+    try:
+        # The ballot row claims (poll, user) first, so a concurrent second ballot fails as a whole
+        db.session.add(Ballot(poll_id=poll.id, user_id=current_user.id))
+        db.session.flush()
+        db.session.execute(Vote.__table__.insert(), [{
+            'poll_id': poll.id,
+            'option_id': option_id,
+            'user_id': current_user.id,
+            'vote_value': value
+        } for option_id, value in entries])
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'message': 'You have already voted!'}), 400
+    
+    # The bulk insert returns no ids; read the ballot back through the (poll_id, user_id) index
+    vote_tally.record_many(
+        db.session.query(Vote.id, Vote.poll_id, Vote.option_id)
+        .filter_by(poll_id=poll.id, user_id=current_user.id)
+        .all()
+    )
+    vote_broadcaster.mark(poll.id)
+    return jsonify({'message': 'Ballot submitted successfully!', 'votes': len(entries)})
+
+@app.route('/api/polls/<int:poll_id>/results', methods=['GET'])
+@token_required
+def get_poll_results(current_user, poll_id):
+    poll = Poll.query.get_or_404(poll_id)
+    counts = vote_tally.counts(poll.id)
+    try:
+        outcome = poll_results.get(poll, request.args.get('method'), poll_option_ids(poll))
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    return jsonify({
+        'poll_id': poll.id,
+        'question': poll.question,
+        'total_votes': sum(counts.values()),
+        'results': [{'option_id': option_id, 'vote_count': count} for option_id, count in counts.items()],
+        'outcome': outcome
+    })
+
+def poll_option_ids(poll):
+    return [option_id for (option_id,) in db.session.query(EventOption.id).filter_by(event_id=poll.event_id)]
+
+@app.route('/api/polls/<int:poll_id>/close', methods=['POST'])
+@token_required
+def close_poll(current_user, poll_id):
+    """Compute the poll's result and record the winner as the event's final decision"""
+    poll = db.get_or_404(Poll, poll_id)
+    event = db.session.get(Event, poll.event_id)
+    if current_user.id != event.created_by and current_user.username != 'superadmin':
+        return jsonify({'message': 'Only the event creator can close this poll'}), 403
+    
+    data = request.get_json(silent=True) or {}
+    try:
+        # Read every vote from the database: the cache only tracks votes this worker counted
+        outcome = poll_results.get(poll, data.get('method'), poll_option_ids(poll), fresh=True)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    if outcome['winner'] is None:
+        return jsonify({'message': 'No votes to decide on yet', 'outcome': outcome}), 400
+    
+    event.final_decision = outcome['winner']
+    event.status = 'decided'
     db.session.commit()
     
-    return jsonify({'message': 'Vote cast successfully!'})
+    decision = {'event_id': event.id, 'poll_id': poll.id, 'option_id': outcome['winner'], 'method': outcome['method']}
+    room_replay.broadcast(socketio, 'decision_made', {'decision': decision}, f'event_{event.id}')
+    return jsonify({'message': 'Poll closed', 'final_decision': outcome['winner'], 'outcome': outcome})
 
 # Admin-only endpoints
 @app.route('/api/admin/stats', methods=['GET'])
@@ -436,7 +627,18 @@ def get_admin_stats(current_user):
                 'groups': recent_groups,
                 'events': recent_events,
                 'enquiries': recent_enquiries
-            }
+            },
+            'api_cache': {
+                'places': GooglePlacesService.cache.stats(),
+                'weather': OpenWeatherService.cache.stats()
+            },
+            'api_breakers': {
+                'places': GooglePlacesService.breaker.stats(),
+                'movies': TMDBService.breaker.stats(),
+                'weather': OpenWeatherService.breaker.stats()
+            },
+            'sockets': connection_registry.stats(),
+            'room_replay': room_replay.stats()
         })
         
     except Exception as e:
@@ -488,7 +690,7 @@ def get_system_activity(current_user):
                 'id': group.id,
                 'name': group.name,
                 'creator': User.query.get(group.created_by).username if User.query.get(group.created_by) else 'Unknown',
-                'members': len(group.members),
+                'members': group.member_count,
                 'created_at': group.created_at.strftime('%Y-%m-%d %H:%M')
             } for group in recent_groups],
             
@@ -558,11 +760,15 @@ def clear_demo_data(current_user):
         # Clear demo data (keep super admin)
         deleted_counts = {}
         
-        # Delete email logs
+        # Delete email logs (including any still buffered)
+        EmailTracker.flush()
         deleted_counts['email_logs'] = EmailLog.query.delete()
+        EmailStatsHourly.query.delete()
+        deleted_counts['outbound_emails'] = OutboundEmail.query.delete()
         
         # Delete votes
         deleted_counts['votes'] = Vote.query.delete()
+        Ballot.query.delete()
         
         # Delete event options
         deleted_counts['event_options'] = EventOption.query.delete()
@@ -573,6 +779,10 @@ def clear_demo_data(current_user):
         # Delete group members
         deleted_counts['group_members'] = GroupMember.query.delete()
         
+        # Delete chat history
+        chat_writer.flush()
+        deleted_counts['chat_messages'] = ChatMessage.query.delete()
+        
         # Delete events
         deleted_counts['events'] = Event.query.delete()
         
@@ -586,6 +796,8 @@ def clear_demo_data(current_user):
         deleted_counts['users'] = User.query.filter(User.username != Config.SUPER_ADMIN_USERNAME).delete()
         
         db.session.commit()
+        clear_user_cache()
+        vote_tally.forget()
         
         return jsonify({
             'message': 'Demo data cleared successfully!',
@@ -596,40 +808,16 @@ def clear_demo_data(current_user):
         db.session.rollback()
         return jsonify({'message': f'Error clearing demo data: {str(e)}'}), 500
 
-@app.route('/api/admin/resend-email', methods=['POST'])
-@token_required
-def resend_email(current_user):
-    # Check if user is super admin
-    if current_user.username != Config.SUPER_ADMIN_USERNAME:
-        return jsonify({'message': 'Admin access required!'}), 403
-    
-    try:
-        data = request.get_json()
-        user_id = data.get('user_id')
-        
-        if not user_id:
-            return jsonify({'message': 'User ID required!'}), 400
-        
-        # Get user details
-        user = db.session.get(User, user_id)
-        if not user:
-            return jsonify({'message': 'User not found!'}), 404
-        
-        # Generate new password
-        from database import generate_random_password
-        new_password = generate_random_password()
-        user.password = new_password
-        db.session.commit()
-        
-        # Send welcome email with new password
-        subject = '🎉 Plan My Outings - Account Credentials (Resent)'
-        try:
-            user_msg = Message(
-                subject=subject,
-                sender=app.config['MAIL_USERNAME'],
-                recipients=[user.email]
-            )
-            user_msg.body = f"""
+RESEND_SUBJECT = '🎉 Plan My Outings - Account Credentials (Resent)'
+
+def credentials_resend_message(user, new_password):
+    """Email carrying a user's regenerated password"""
+    user_msg = Message(
+        subject=RESEND_SUBJECT,
+        sender=app.config['MAIL_USERNAME'],
+        recipients=[user.email]
+    )
+    user_msg.body = f"""
 🎉 Welcome to Plan My Outings, {user.first_name}!
 ============================================
 
@@ -662,9 +850,39 @@ The Plan My Outings Team
 
 ---
 This email was resent to {user.email} by system administrator.
-            """
-            
-            mail.send(user_msg)
+    """
+    return user_msg
+
+@app.route('/api/admin/resend-email', methods=['POST'])
+@token_required
+def resend_email(current_user):
+    # Check if user is super admin
+    if current_user.username != Config.SUPER_ADMIN_USERNAME:
+        return jsonify({'message': 'Admin access required!'}), 403
+    
+    try:
+        data = request.get_json()
+        user_id = data.get('user_id')
+        
+        if not user_id:
+            return jsonify({'message': 'User ID required!'}), 400
+        
+        # Get user details
+        user = db.session.get(User, user_id)
+        if not user:
+            return jsonify({'message': 'User not found!'}), 404
+        
+        # Generate new password
+        from database import generate_random_password
+        new_password = generate_random_password()
+        user.password = new_password
+        db.session.commit()
+        invalidate_user(user.id)
+        
+        # Send welcome email with new password
+        subject = RESEND_SUBJECT
+        try:
+            smtp_pool.send(credentials_resend_message(user, new_password))
             # Log successful resend
             EmailTracker.log_email_sent(user.email, subject, 'resend', user.id)
             
@@ -681,6 +899,56 @@ This email was resent to {user.email} by system administrator.
     except Exception as e:
         return jsonify({'message': f'Error resending email: {str(e)}'}), 500
 
+@app.route('/api/admin/groups/<int:group_id>/resend-credentials', methods=['POST'])
+@token_required
+def resend_group_credentials(current_user, group_id):
+    # Check if user is super admin
+    if current_user.username != Config.SUPER_ADMIN_USERNAME:
+        return jsonify({'message': 'Admin access required!'}), 403
+    
+    try:
+        group = db.session.get(Group, group_id)
+        if not group:
+            return jsonify({'message': 'Group not found!'}), 404
+        
+        # Generate new passwords for every member except the super admin, whose login this must never change
+        from database import generate_random_password
+        users = (User.query.join(GroupMember, GroupMember.user_id == User.id)
+                 .filter(GroupMember.group_id == group_id, User.username != Config.SUPER_ADMIN_USERNAME)
+                 .all())
+        passwords = {}
+        for user in users:
+            passwords[user.id] = user.password = generate_random_password()
+        db.session.commit()
+        for user in users:
+            invalidate_user(user.id)
+        
+        # One pooled SMTP connection for the whole batch
+        errors = smtp_pool.send_many(credentials_resend_message(user, passwords[user.id]) for user in users)
+        
+        results = []
+        for user, error in zip(users, errors):
+            if error is None:
+                EmailTracker.log_email_sent(user.email, RESEND_SUBJECT, 'resend', user.id)
+            else:
+                EmailTracker.log_email_failed(user.email, RESEND_SUBJECT, 'resend', str(error), user.id)
+            results.append({
+                'user_id': user.id,
+                'username': user.username,
+                'sent': error is None,
+                'error': str(error) if error else None
+            })
+        
+        sent = sum(1 for result in results if result['sent'])
+        return jsonify({
+            'message': f'Credentials resent to {sent} of {len(results)} members',
+            'results': results
+        })
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'message': f'Error resending group credentials: {str(e)}'}), 500
+
 def create_super_admin():
     """Create super admin account if it doesn't exist"""
     try:
@@ -737,7 +1005,7 @@ Keep these credentials secure!
 
 Plan My Outings System
                     """
-                    mail.send(msg)
+                    smtp_pool.send(msg)
                     # Log super admin email
                     EmailTracker.log_email_sent(admin_email, 'Plan My Outings - Super Admin Account Created', 'admin_setup')
                     print("✅ Super admin welcome email sent")
@@ -754,8 +1022,20 @@ Plan My Outings System
 def home():
     return jsonify({"message": "Plan My Outings API"})
 
-if __name__ == '__main__':
+def prepare_database():
+    """Create and migrate the schema and make sure the super admin exists"""
     with app.app_context():
         db.create_all()
+        ensure_group_counter_columns()
+        ensure_indexes()
+        ensure_ballots()
+        ensure_hourly_stats()
+        clear_finished_bodies()
         create_super_admin()
+
+if __name__ == '__main__':
+    prepare_database()
+    # debug=True runs the reloader; only its serving child process starts the workers
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        mail_queue.start(app, smtp_pool)
     socketio.run(app, debug=True, port=5000)
@@ -1,37 +1,146 @@
 from flask import jsonify, request
 import jwt
 import datetime
+import os
+import threading
+import time
+from collections import OrderedDict
 from functools import wraps
 from database import User, db
 from config import Config
 
+class AuthenticatedUserCache:
+    """Bounded LRU cache of token -> authenticated user.
+
+    Entries hold detached User snapshots and expire after AUTH_CACHE_TTL
+    seconds or when the token itself expires, whichever comes first.
+    Invalidation is shared with other processes (CLI, extra workers)
+    through the mtime of a stamp file: touching it clears every cache.
+    """
+
+    def __init__(self, max_size, ttl, stamp_file):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.stamp_file = stamp_file
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stamp = self._read_stamp()
+
+    def _read_stamp(self):
+        try:
+            return os.stat(self.stamp_file).st_mtime_ns
+        except OSError:
+            return None
+
+    def get(self, token):
+        stamp = self._read_stamp()
+        with self._lock:
+            if stamp != self._stamp:
+                self._entries.clear()
+                self._stamp = stamp
+                return None
+
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+
+            user, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[token]
+                return None
+
+            self._entries.move_to_end(token)
+            return user
+
+    def put(self, token, user, token_exp):
+        expires_at = min(time.time() + self.ttl, token_exp)
+        with self._lock:
+            self._entries[token] = (user, expires_at)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            for token in [token for token, (user, _) in self._entries.items() if user.id == user_id]:
+                del self._entries[token]
+        self._touch_stamp()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        self._touch_stamp()
+
+    def _touch_stamp(self):
+        try:
+            os.makedirs(os.path.dirname(self.stamp_file), exist_ok=True)
+            with open(self.stamp_file, 'a'):
+                os.utime(self.stamp_file, None)
+        except OSError as e:
+            print(f"Warning: Could not update auth cache stamp: {e}")
+
+_user_cache = AuthenticatedUserCache(Config.AUTH_CACHE_SIZE, Config.AUTH_CACHE_TTL, Config.AUTH_CACHE_STAMP_FILE)
+
+def invalidate_user(user_id):
+    """Drop cached logins for a user (call after password change/update/delete)"""
+    _user_cache.invalidate_user(user_id)
+
+def clear_user_cache():
+    """Drop every cached login (call after bulk user deletes)"""
+    _user_cache.clear()
+
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
         token = request.headers.get('Authorization')
-        
+
         if not token:
             return jsonify({'message': 'Token is missing!'}), 401
-        
+
+        if token.startswith('Bearer '):
+            token = token[7:]
+
+        cached_user = _user_cache.get(token)
+        if cached_user is not None:
+            # Attach the cached snapshot to this request's session without a query
+            current_user = db.session.merge(cached_user, load=False)
+            return f(current_user, *args, **kwargs)
+
         try:
-            if token.startswith('Bearer '):
-                token = token[7:]
-            
             data = jwt.decode(token, Config.SECRET_KEY, algorithms=["HS256"])
-            current_user = User.query.get(data['user_id'])
-            
+            current_user = db.session.get(User, data['user_id'])
+
             if not current_user:
                 return jsonify({'message': 'User not found!'}), 401
-                
+
         except jwt.ExpiredSignatureError:
             return jsonify({'message': 'Token has expired!'}), 401
         except jwt.InvalidTokenError:
             return jsonify({'message': 'Token is invalid!'}), 401
-        
+
+        # Cache a detached copy so later commits in this session can't expire it
+        db.session.expunge(current_user)
+        _user_cache.put(token, current_user, data['exp'])
+        current_user = db.session.merge(current_user, load=False)
+
         return f(current_user, *args, **kwargs)
-    
+
     return decorated
 
+def user_id_from_token(token):
+    """User id a token was issued for, or None if it is missing, expired or invalid (no query)"""
+    if not token:
+        return None
+    if token.startswith('Bearer '):
+        token = token[7:]
+    cached_user = _user_cache.get(token)
+    if cached_user is not None:
+        return cached_user.id
+    try:
+        return jwt.decode(token, Config.SECRET_KEY, algorithms=["HS256"])['user_id']
+    except (jwt.InvalidTokenError, KeyError):
+        return None
+
 def generate_token(user):
     payload = {
         'user_id': user.id,
@@ -9,9 +9,14 @@ import os
 import smtplib
 from datetime import datetime
 from tabulate import tabulate
-from database import db, User, Group, Event, Enquiry, GroupMember, Poll, EventOption, Vote
+from database import db, User, Group, Event, Enquiry, GroupMember, Poll, EventOption, Vote, Ballot
+from group_chat import ChatMessage
+from database import recount_group_counters, ensure_group_counter_columns, ensure_indexes
+from database import active_sqlite_pragmas, sqlite_pragmas
+from email_tracking import ensure_hourly_stats, rebuild_hourly_stats
 from sqlalchemy import text
 from app import app
+from auth import invalidate_user, clear_user_cache
 from config import Config
 
 class CLIAdmin:
@@ -177,16 +182,14 @@ class CLIAdmin:
         data = []
         for group in groups:
             creator = db.session.get(User, group.created_by)
-            member_count = len(group.members)
-            event_count = len(group.events)
             
             data.append([
                 group.id,
                 group.name,
                 group.description[:50] + "..." if len(group.description or "") > 50 else group.description or "",
                 creator.username if creator else "Unknown",
-                member_count,
-                event_count,
+                group.member_count,
+                group.event_count,
                 group.created_at.strftime("%Y-%m-%d")
             ])
         
@@ -355,6 +358,7 @@ class CLIAdmin:
                 user.password = new_password
             
             db.session.commit()
+            invalidate_user(user.id)
             print("✅ User updated successfully!")
             
         except ValueError:
@@ -410,9 +414,15 @@ class CLIAdmin:
             # Delete user's data in correct order to avoid foreign key constraints
             print("Deleting user's votes...")
             Vote.query.filter_by(user_id=user.id).delete()
+            Ballot.query.filter_by(user_id=user.id).delete()
+            
+            print("Deleting user's chat messages...")
+            ChatMessage.query.filter_by(user_id=user.id).delete()
             
             print("Deleting user's group memberships...")
-            GroupMember.query.filter_by(user_id=user.id).delete()
+            # Delete row by row so the Group.member_count of each group is updated
+            for membership in GroupMember.query.filter_by(user_id=user.id).all():
+                db.session.delete(membership)
             
             print("Deleting events created by user...")
             user_events = Event.query.filter_by(created_by=user.id).all()
@@ -421,6 +431,7 @@ class CLIAdmin:
                 polls = Poll.query.filter_by(event_id=event.id).all()
                 for poll in polls:
                     Vote.query.filter_by(poll_id=poll.id).delete()
+                    Ballot.query.filter_by(poll_id=poll.id).delete()
                     db.session.delete(poll)
                 
                 # Delete event options
@@ -430,8 +441,9 @@ class CLIAdmin:
             print("Deleting groups created by user...")
             user_groups = Group.query.filter_by(created_by=user.id).all()
             for group in user_groups:
-                # Delete group memberships
+                # Delete group memberships and chat history
                 GroupMember.query.filter_by(group_id=group.id).delete()
+                ChatMessage.query.filter_by(group_id=group.id).delete()
                 
                 # Delete events in this group
                 group_events = Event.query.filter_by(group_id=group.id).all()
@@ -439,6 +451,7 @@ class CLIAdmin:
                     polls = Poll.query.filter_by(event_id=event.id).all()
                     for poll in polls:
                         Vote.query.filter_by(poll_id=poll.id).delete()
+                        Ballot.query.filter_by(poll_id=poll.id).delete()
                         db.session.delete(poll)
                     EventOption.query.filter_by(event_id=event.id).delete()
                     db.session.delete(event)
@@ -448,6 +461,7 @@ class CLIAdmin:
             print("Deleting user...")
             db.session.delete(user)
             db.session.commit()
+            invalidate_user(user_id)
             print("✅ User deleted successfully!")
             
         except ValueError:
@@ -595,7 +609,7 @@ class CLIAdmin:
             print(f"ID: {group.id}")
             print(f"Name: {group.name}")
             print(f"Creator: {creator.username if creator else 'Unknown'}")
-            print(f"Members: {len(group.members)}")
+            print(f"Members: {group.member_count}")
             print(f"Events: {events_count}")
             
             if events_count > 0:
@@ -606,6 +620,8 @@ class CLIAdmin:
                 print("❌ Deletion cancelled.")
                 return
             
+            # Chat history has no ORM relationship to cascade through
+            ChatMessage.query.filter_by(group_id=group.id).delete()
             # Delete group (cascade will handle related records)
             db.session.delete(group)
             db.session.commit()
@@ -634,7 +650,7 @@ class CLIAdmin:
         total_members = 0
         
         for group in Group.query.all():
-            member_count = len(group.members)
+            member_count = group.member_count
             total_members += member_count
             
             if member_count == 1:
@@ -658,14 +674,12 @@ class CLIAdmin:
         # Most active groups
         print(f"\n🏆 Most Active Groups (by events):")
         groups_with_events = []
-        for group in Group.query.all():
-            event_count = Event.query.filter_by(group_id=group.id).count()
-            if event_count > 0:
-                groups_with_events.append([
-                    group.name,
-                    len(group.members),
-                    event_count
-                ])
+        for group in Group.query.filter(Group.event_count > 0).all():
+            groups_with_events.append([
+                group.name,
+                group.member_count,
+                group.event_count
+            ])
         
         groups_with_events.sort(key=lambda x: x[2], reverse=True)
         
@@ -748,8 +762,10 @@ class CLIAdmin:
             for user in test_users:
                 print(f"Deleting user: {user.username}")
                 
-                # Delete user's votes first
+                # Delete user's votes and chat messages first
                 Vote.query.filter_by(user_id=user.id).delete()
+                Ballot.query.filter_by(user_id=user.id).delete()
+                ChatMessage.query.filter_by(user_id=user.id).delete()
                 
                 # Delete events created by this user
                 events_created = Event.query.filter_by(created_by=user.id).all()
@@ -757,13 +773,15 @@ class CLIAdmin:
                     # Delete event options and votes for this event
                     EventOption.query.filter_by(event_id=event.id).delete()
                     Vote.query.filter_by(poll_id=event.id).delete()  # If polls are linked to events
+                    Ballot.query.filter_by(poll_id=event.id).delete()
                     db.session.delete(event)
                 
                 # Delete groups created by this user
                 groups_created = Group.query.filter_by(created_by=user.id).all()
                 for group in groups_created:
-                    # Delete group memberships
+                    # Delete group memberships and chat history
                     GroupMember.query.filter_by(group_id=group.id).delete()
+                    ChatMessage.query.filter_by(group_id=group.id).delete()
                     # Delete events in this group
                     group_events = Event.query.filter_by(group_id=group.id).all()
                     for event in group_events:
@@ -772,7 +790,9 @@ class CLIAdmin:
                     db.session.delete(group)
                 
                 # Delete user's group memberships
-                GroupMember.query.filter_by(user_id=user.id).delete()
+                # Delete row by row so the Group.member_count of each group is updated
+                for membership in GroupMember.query.filter_by(user_id=user.id).all():
+                    db.session.delete(membership)
                 
                 # Delete polls for events created by this user (polls don't have created_by field)
                 user_events = Event.query.filter_by(created_by=user.id).all()
@@ -780,6 +800,7 @@ class CLIAdmin:
                     polls = Poll.query.filter_by(event_id=event.id).all()
                     for poll in polls:
                         Vote.query.filter_by(poll_id=poll.id).delete()
+                        Ballot.query.filter_by(poll_id=poll.id).delete()
                         db.session.delete(poll)
                 
                 # Finally delete the user
@@ -797,6 +818,7 @@ class CLIAdmin:
                 db.session.delete(enquiry)
             
             db.session.commit()
+            clear_user_cache()
             print(f"✅ Deleted {deleted_count} test users and {enquiry_count} test enquiries with all associated data.")
             
         except Exception as e:
@@ -833,6 +855,13 @@ class CLIAdmin:
             print(f"Polls: {Poll.query.count()}")
             print(f"Votes: {Vote.query.count()}")
             
+            if db.engine.dialect.name == 'sqlite':
+                print(f"\n⚙️ SQLite Settings:")
+                configured = sqlite_pragmas(app.config)
+                data = [[name, value, configured.get(name, "-")]
+                        for name, value in active_sqlite_pragmas().items()]
+                print(tabulate(data, headers=["Pragma", "Active", "Configured"], tablefmt="grid"))
+            
         except Exception as e:
             print(f"❌ Error getting database info: {e}")
     
@@ -857,6 +886,8 @@ class CLIAdmin:
         try:
             # Delete all data except super admin
             Vote.query.delete()
+            Ballot.query.delete()
+            ChatMessage.query.delete()
             EventOption.query.delete()
             Poll.query.delete()
             GroupMember.query.delete()
@@ -868,6 +899,7 @@ class CLIAdmin:
             User.query.filter(User.username != Config.SUPER_ADMIN_USERNAME).delete()
             
             db.session.commit()
+            clear_user_cache()
             print("✅ All data cleared successfully!")
             print("Only the super admin account remains.")
             
@@ -1195,7 +1227,7 @@ class CLIAdmin:
         # Basic email sending functionality
         try:
             from flask_mail import Message
-            from app import mail, app
+            from app import smtp_pool, app
             
             if not app.config.get('MAIL_USERNAME'):
                 print("❌ Email not configured!")
@@ -1221,7 +1253,7 @@ class CLIAdmin:
             )
             msg.body = message_body
             
-            mail.send(msg)
+            smtp_pool.send(msg)
             print("✅ Email sent successfully!")
             
         except Exception as e:
@@ -1234,7 +1266,7 @@ class CLIAdmin:
         
         try:
             from flask_mail import Message
-            from app import mail, app
+            from app import smtp_pool, app
             from config import Config
             
             if not app.config.get('MAIL_USERNAME'):
@@ -1292,7 +1324,7 @@ Plan My Outings System
             
             print("Attempting to send email...")
             # Send the email
-            mail.send(msg)
+            smtp_pool.send(msg)
             print("✅ Super admin credentials sent successfully!")
             print(f"📧 Email sent to: {Config.SUPER_ADMIN_EMAIL}")
             print("\nThis confirms that:")
@@ -1429,19 +1461,26 @@ Plan My Outings System
             return
         
         try:
-            from email_tracking import EmailLog
+            from email_tracking import EmailLog, EmailTracker, EmailStatsHourly
             
             print("\n🗑️ Clearing demo data...")
             deleted_counts = {}
             
-            # Delete email logs
+            # Delete email logs (including any still buffered)
+            EmailTracker.flush()
             deleted_counts['email_logs'] = EmailLog.query.delete()
+            EmailStatsHourly.query.delete()
             print(f"  ✅ Deleted {deleted_counts['email_logs']} email logs")
             
             # Delete votes
             deleted_counts['votes'] = Vote.query.delete()
+            Ballot.query.delete()
             print(f"  ✅ Deleted {deleted_counts['votes']} votes")
             
+            # Delete chat messages
+            deleted_counts['chat_messages'] = ChatMessage.query.delete()
+            print(f"  ✅ Deleted {deleted_counts['chat_messages']} chat messages")
+            
             # Delete event options
             deleted_counts['event_options'] = EventOption.query.delete()
             print(f"  ✅ Deleted {deleted_counts['event_options']} event options")
@@ -1471,6 +1510,7 @@ Plan My Outings System
             print(f"  ✅ Deleted {deleted_counts['users']} users (kept super admin)")
             
             db.session.commit()
+            clear_user_cache()
             
             print(f"\n✅ ALL DEMO DATA CLEARED SUCCESSFULLY!")
             print(f"📊 Summary:")
@@ -2110,6 +2150,7 @@ Plan My Outings System
                 user.password = new_password
             
             db.session.commit()
+            invalidate_user(user.id)
             print("✅ User updated successfully!")
             
         except ValueError:
@@ -2299,9 +2340,15 @@ Plan My Outings System
             # Delete user's data in correct order to avoid foreign key constraints
             print("Deleting user's votes...")
             Vote.query.filter_by(user_id=user.id).delete()
+            Ballot.query.filter_by(user_id=user.id).delete()
+            
+            print("Deleting user's chat messages...")
+            ChatMessage.query.filter_by(user_id=user.id).delete()
             
             print("Deleting user's group memberships...")
-            GroupMember.query.filter_by(user_id=user.id).delete()
+            # Delete row by row so the Group.member_count of each group is updated
+            for membership in GroupMember.query.filter_by(user_id=user.id).all():
+                db.session.delete(membership)
             
             print("Deleting events created by user...")
             user_events = Event.query.filter_by(created_by=user.id).all()
@@ -2310,6 +2357,7 @@ Plan My Outings System
                 polls = Poll.query.filter_by(event_id=event.id).all()
                 for poll in polls:
                     Vote.query.filter_by(poll_id=poll.id).delete()
+                    Ballot.query.filter_by(poll_id=poll.id).delete()
                     db.session.delete(poll)
                 
                 # Delete event options
@@ -2319,8 +2367,9 @@ Plan My Outings System
             print("Deleting groups created by user...")
             user_groups = Group.query.filter_by(created_by=user.id).all()
             for group in user_groups:
-                # Delete group memberships
+                # Delete group memberships and chat history
                 GroupMember.query.filter_by(group_id=group.id).delete()
+                ChatMessage.query.filter_by(group_id=group.id).delete()
                 
                 # Delete events in this group
                 group_events = Event.query.filter_by(group_id=group.id).all()
@@ -2328,6 +2377,7 @@ Plan My Outings System
                     polls = Poll.query.filter_by(event_id=event.id).all()
                     for poll in polls:
                         Vote.query.filter_by(poll_id=poll.id).delete()
+                        Ballot.query.filter_by(poll_id=poll.id).delete()
                         db.session.delete(poll)
                     EventOption.query.filter_by(event_id=event.id).delete()
                     db.session.delete(event)
@@ -2337,6 +2387,7 @@ Plan My Outings System
             print("Deleting user...")
             db.session.delete(user)
             db.session.commit()
+            invalidate_user(user_id)
             print("✅ User deleted successfully!")
             
         except ValueError:
@@ -2374,6 +2425,7 @@ Plan My Outings System
                 print("❌ Deletion cancelled.")
                 return
             
+            ChatMessage.query.filter_by(group_id=group.id).delete()
             db.session.delete(group)
             db.session.commit()
             print("✅ Group deleted successfully!")
@@ -2480,8 +2532,10 @@ Plan My Outings System
         print("2. Check database integrity")
         print("3. Analyze database")
         print("4. Show database size")
+        print("5. Recount group member/event counters")
+        print("6. Rebuild email statistics rollup")
         
-        choice = input("Select maintenance operation (1-4): ")
+        choice = input("Select maintenance operation (1-6): ")
         
         try:
             if choice == '1':
@@ -2508,12 +2562,36 @@ Plan My Outings System
                     print(f"Database size: {size_mb:.2f} MB ({size} bytes)")
                 else:
                     print("❌ Database file not found!")
+            elif choice == '5':
+                self.recount_group_counters()
+            elif choice == '6':
+                hours = rebuild_hourly_stats()
+                print(f"✅ Email statistics rebuilt ({hours} hours)")
             else:
                 print("❌ Invalid choice!")
                 
         except Exception as e:
             print(f"❌ Error during maintenance: {e}")
     
+    def recount_group_counters(self):
+        """Repair drift in the denormalized Group.member_count / event_count columns"""
+        try:
+            repaired = recount_group_counters()
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ Error recounting groups: {e}")
+            return
+        
+        if not repaired:
+            print("✅ All group counters are correct.")
+            return
+        
+        data = [[group_id, name, f"{old_members} → {members}", f"{old_events} → {events}"]
+                for group_id, name, old_members, members, old_events, events in repaired]
+        headers = ["ID", "Name", "Members", "Events"]
+        print(f"\n🔧 Repaired {len(repaired)} groups:")
+        print(tabulate(data, headers=headers, tablefmt="grid"))
+    
     def export_data(self):
         """Export data to files"""
         print("\n📤 EXPORT DATA")
@@ -2713,5 +2791,8 @@ Plan My Outings System
 
 if __name__ == "__main__":
     with app.app_context():
+        ensure_group_counter_columns()
+        ensure_indexes()
+        ensure_hourly_stats()
         admin = CLIAdmin()
         admin.run()
\ No newline at end of file
@@ -1,51 +1,171 @@
 import os
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
 
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+
 # Import encryption utilities at module level
 try:
     import cryptography
-    from encryption_utils import decrypt_env_password
+    from encryption_utils import decrypt_many
     ENCRYPTION_AVAILABLE = True
 except ImportError as e:
     # Silently handle missing encryption in development reloader
     ENCRYPTION_AVAILABLE = False
-    decrypt_env_password = None
-
-def _decrypt_if_needed(value):
-    """Helper function to decrypt values if they are encrypted"""
-    if value and value.startswith('ENC:') and ENCRYPTION_AVAILABLE:
-        try:
-            return decrypt_env_password(value)
-        except Exception as e:
-            print(f"Warning: Could not decrypt value: {e}")
-            return None
-    return value
+    decrypt_many = None
+
+# Settings that may be stored encrypted ('ENC:...') in .env
+ENCRYPTED_SETTINGS = (
+    'MAIL_USERNAME',
+    'MAIL_PASSWORD',
+    'SUPER_ADMIN_EMAIL',
+    'SUPER_ADMIN_USERNAME',
+    'SUPER_ADMIN_PASSWORD',
+    'SUPER_ADMIN_FIRST_NAME',
+    'SUPER_ADMIN_LAST_NAME',
+)
+
+# Seconds spent decrypting settings on import (see performance_test.py)
+DECRYPT_SECONDS = 0.0
+
+def _decrypt_settings(names):
+    """Read and decrypt settings in one batch (single key derivation)"""
+    global DECRYPT_SECONDS
+    values = {name: os.environ.get(name) for name in names}
+    if not ENCRYPTION_AVAILABLE:
+        return values
+    
+    started = time.perf_counter()
+    try:
+        return decrypt_many(values)
+    except Exception as e:
+        # Only reached if the key itself is unusable; decrypt_many handles bad values one by one
+        print(f"Warning: Could not decrypt values: {e}")
+        return {name: None if value and value.startswith('ENC:') else value
+                for name, value in values.items()}
+    finally:
+        DECRYPT_SECONDS = time.perf_counter() - started
+
+_settings = _decrypt_settings(ENCRYPTED_SETTINGS)
 
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key'
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///plan_my_outings.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # SQLite pragmas applied on every connection (see database.configure_sqlite); empty disables one
+    SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_BUSY_TIMEOUT = os.environ.get('SQLITE_BUSY_TIMEOUT', '5000')  # milliseconds
+    SQLITE_CACHE_SIZE = os.environ.get('SQLITE_CACHE_SIZE', '-65536')  # negative = KiB, i.e. 64 MB
+    SQLITE_MMAP_SIZE = os.environ.get('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024))  # bytes
+    SQLITE_TEMP_STORE = os.environ.get('SQLITE_TEMP_STORE', 'MEMORY')
+    
+    # Authenticated-user cache (see auth.token_required)
+    AUTH_CACHE_SIZE = int(os.environ.get('AUTH_CACHE_SIZE') or 1024)
+    AUTH_CACHE_TTL = int(os.environ.get('AUTH_CACHE_TTL') or 300)  # seconds, capped at token expiry
+    AUTH_CACHE_STAMP_FILE = os.environ.get('AUTH_CACHE_STAMP_FILE') or os.path.join(BASE_DIR, 'instance', 'auth_cache.stamp')
+    
     # Email configuration
     MAIL_SERVER = os.environ.get('MAIL_SERVER') or 'smtp.gmail.com'
     MAIL_PORT = int(os.environ.get('MAIL_PORT') or 587)
     MAIL_USE_TLS = os.environ.get('MAIL_USE_TLS', 'True').lower() == 'true'
     MAIL_USE_SSL = os.environ.get('MAIL_USE_SSL', 'False').lower() == 'true'
     
+    # Pooled SMTP connections (see smtp_pool.py)
+    SMTP_POOL_SIZE = int(os.environ.get('SMTP_POOL_SIZE') or 3)
+    SMTP_POOL_MAX_IDLE = int(os.environ.get('SMTP_POOL_MAX_IDLE') or 60)  # seconds before reconnecting
+    
+    # Buffered email logging (see email_tracking.EmailLogWriter)
+    EMAIL_LOG_BATCH_SIZE = int(os.environ.get('EMAIL_LOG_BATCH_SIZE') or 100)
+    EMAIL_LOG_FLUSH_INTERVAL = float(os.environ.get('EMAIL_LOG_FLUSH_INTERVAL') or 2)  # seconds
+    
+    # Outbound mail queue (see mail_queue.py)
+    MAIL_QUEUE_WORKERS = int(os.environ.get('MAIL_QUEUE_WORKERS') or 2)
+    MAIL_QUEUE_MAX_ATTEMPTS = int(os.environ.get('MAIL_QUEUE_MAX_ATTEMPTS') or 5)
+    MAIL_QUEUE_BACKOFF = int(os.environ.get('MAIL_QUEUE_BACKOFF') or 30)  # seconds, doubled per retry
+    MAIL_QUEUE_POLL_INTERVAL = float(os.environ.get('MAIL_QUEUE_POLL_INTERVAL') or 5)  # seconds
+    
     # Decrypt email credentials
-    MAIL_USERNAME = _decrypt_if_needed(os.environ.get('MAIL_USERNAME'))
-    MAIL_PASSWORD = _decrypt_if_needed(os.environ.get('MAIL_PASSWORD'))
+    MAIL_USERNAME = _settings['MAIL_USERNAME']
+    MAIL_PASSWORD = _settings['MAIL_PASSWORD']
     
     # API Keys
     GOOGLE_PLACES_API_KEY = os.environ.get('GOOGLE_PLACES_API_KEY')
     TMDB_API_KEY = os.environ.get('TMDB_API_KEY')
     OPENWEATHER_API_KEY = os.environ.get('OPENWEATHER_API_KEY')
     
+    # Outbound HTTP to the API providers (see api_services.http_get)
+    HTTP_CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT') or 3.05)  # seconds
+    HTTP_READ_TIMEOUT = float(os.environ.get('HTTP_READ_TIMEOUT') or 10)  # seconds
+    HTTP_POOL_HOSTS = int(os.environ.get('HTTP_POOL_HOSTS') or 10)  # hosts with a cached pool
+    HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE') or 10)  # keep-alive connections per host
+    
+    # Weather forecast cache: entries expire at the next 3-hour forecast slot
+    WEATHER_GRID_DEGREES = float(os.environ.get('WEATHER_GRID_DEGREES') or 0.05)  # ~5 km cells
+    WEATHER_CACHE_SIZE = int(os.environ.get('WEATHER_CACHE_SIZE') or 2048)
+    WEATHER_STALE_GRACE = int(os.environ.get('WEATHER_STALE_GRACE') or 1800)  # seconds served stale while refreshing
+    
+    # Local TMDB movie catalog (see movie_catalog.py)
+    MOVIE_CATALOG_PATH = os.environ.get('MOVIE_CATALOG_PATH') or os.path.join(BASE_DIR, 'instance', 'movie_catalog.jsonl')
+    
+    # Places search cache (see api_services.ResponseCache)
+    PLACES_CACHE_SIZE = int(os.environ.get('PLACES_CACHE_SIZE') or 1024)
+    PLACES_CACHE_TTL = int(os.environ.get('PLACES_CACHE_TTL') or 600)  # seconds
+    
+    # In-memory vote counts (see vote_tally.py)
+    VOTE_TALLY_POLLS = int(os.environ.get('VOTE_TALLY_POLLS') or 10000)  # polls kept in memory
+    VOTE_TALLY_TTL = int(os.environ.get('VOTE_TALLY_TTL') or 300)  # seconds before a poll is recounted
+    
+    # Serving: app.py runs the threaded dev server; serve.py runs cooperative workers
+    SOCKETIO_ASYNC_MODE = os.environ.get('SOCKETIO_ASYNC_MODE') or 'threading'  # 'threading', 'eventlet' or 'gevent'
+    SERVER_HOST = os.environ.get('SERVER_HOST') or '0.0.0.0'
+    SERVER_PORT = int(os.environ.get('SERVER_PORT') or 5000)
+    SERVER_MAX_CONNECTIONS = int(os.environ.get('SERVER_MAX_CONNECTIONS') or 20000)  # concurrent sockets per worker
+    
+    # Socket.IO bus shared by backend workers (see socket_bus.py); unset = single process
+    SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE')  # e.g. sqlite:///instance/socketio_bus.db, redis://localhost:6379/0
+    SOCKETIO_CHANNEL = os.environ.get('SOCKETIO_CHANNEL') or 'plan-my-outings'
+    
+    # vote_update broadcasts are coalesced per poll over this window
+    VOTE_BROADCAST_WINDOW = float(os.environ.get('VOTE_BROADCAST_WINDOW') or 0.1)  # seconds
+    
+    # presence_update broadcasts are coalesced per group over this window
+    PRESENCE_BROADCAST_WINDOW = float(os.environ.get('PRESENCE_BROADCAST_WINDOW') or 1.0)  # seconds
+    # Behind a message queue each worker refreshes its presence rows this often; rows not refreshed
+    # for PRESENCE_STALE_SECONDS belong to a worker that died and are ignored
+    PRESENCE_HEARTBEAT = float(os.environ.get('PRESENCE_HEARTBEAT') or 15)  # seconds
+    PRESENCE_STALE_SECONDS = float(os.environ.get('PRESENCE_STALE_SECONDS') or 45)
+    
+    # Broadcasts kept per room for reconnect resync (see room_replay.py)
+    REPLAY_BUFFER_SIZE = int(os.environ.get('REPLAY_BUFFER_SIZE') or 256)  # broadcasts per room
+    REPLAY_MAX_ROOMS = int(os.environ.get('REPLAY_MAX_ROOMS') or 10000)
+    REPLAY_RETENTION = int(os.environ.get('REPLAY_RETENTION') or 86400)  # seconds; behind a message queue only
+    
+    # Group chat (see group_chat.py): messages are stored in batches, then broadcast
+    CHAT_BATCH_SIZE = int(os.environ.get('CHAT_BATCH_SIZE') or 200)
+    CHAT_FLUSH_INTERVAL = float(os.environ.get('CHAT_FLUSH_INTERVAL') or 0.05)  # seconds
+    CHAT_MESSAGE_MAX_LENGTH = int(os.environ.get('CHAT_MESSAGE_MAX_LENGTH') or 2000)  # characters
+    CHAT_HISTORY_MAX_LIMIT = int(os.environ.get('CHAT_HISTORY_MAX_LIMIT') or 200)  # messages per history page
+    
+    # Per-provider circuit breakers (see api_services.CircuitBreaker)
+    BREAKER_WINDOW = float(os.environ.get('BREAKER_WINDOW') or 30)  # seconds of calls the failure rate covers
+    BREAKER_MIN_CALLS = int(os.environ.get('BREAKER_MIN_CALLS') or 5)  # calls in the window before it can trip
+    BREAKER_FAILURE_RATE = float(os.environ.get('BREAKER_FAILURE_RATE') or 0.5)
+    BREAKER_OPEN_SECONDS = float(os.environ.get('BREAKER_OPEN_SECONDS') or 5)  # first cool-down, doubled per failed probe
+    BREAKER_MAX_OPEN_SECONDS = float(os.environ.get('BREAKER_MAX_OPEN_SECONDS') or 300)
+    
+    # /api/events/<id>/suggestions: providers queried in parallel, each with its own deadline
+    SUGGESTION_WORKERS = int(os.environ.get('SUGGESTION_WORKERS') or 12)
+    PLACES_DEADLINE = float(os.environ.get('PLACES_DEADLINE') or 2.5)  # seconds
+    MOVIES_DEADLINE = float(os.environ.get('MOVIES_DEADLINE') or 2.5)  # seconds
+    WEATHER_DEADLINE = float(os.environ.get('WEATHER_DEADLINE') or 2.0)  # seconds
+    
     # Super Admin Configuration (Encrypted)
-    SUPER_ADMIN_EMAIL = _decrypt_if_needed(os.environ.get('SUPER_ADMIN_EMAIL'))
-    SUPER_ADMIN_USERNAME = _decrypt_if_needed(os.environ.get('SUPER_ADMIN_USERNAME'))
-    SUPER_ADMIN_PASSWORD = _decrypt_if_needed(os.environ.get('SUPER_ADMIN_PASSWORD'))
-    SUPER_ADMIN_FIRST_NAME = _decrypt_if_needed(os.environ.get('SUPER_ADMIN_FIRST_NAME'))
-    SUPER_ADMIN_LAST_NAME = _decrypt_if_needed(os.environ.get('SUPER_ADMIN_LAST_NAME'))
+    SUPER_ADMIN_EMAIL = _settings['SUPER_ADMIN_EMAIL']
+    SUPER_ADMIN_USERNAME = _settings['SUPER_ADMIN_USERNAME']
+    SUPER_ADMIN_PASSWORD = _settings['SUPER_ADMIN_PASSWORD']
+    SUPER_ADMIN_FIRST_NAME = _settings['SUPER_ADMIN_FIRST_NAME']
+    SUPER_ADMIN_LAST_NAME = _settings['SUPER_ADMIN_LAST_NAME']
@@ -1,7 +1,13 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, func, inspect, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
 from datetime import datetime
+from collections import Counter
 import random
+import sqlite3
 import string
+import sys
 
 db = SQLAlchemy()
 
@@ -13,7 +19,7 @@ class User(db.Model):
     first_name = db.Column(db.String(50), nullable=False)
     last_name = db.Column(db.String(50), nullable=False)
     year_of_birth = db.Column(db.Integer, nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     
     # Relationships
     groups = db.relationship('GroupMember', backref='user', lazy=True)
@@ -23,14 +29,22 @@ class Group(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
-    created_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    # Denormalized child counts, maintained by _update_group_counters
+    member_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    event_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     # Relationships
     members = db.relationship('GroupMember', backref='group', lazy=True)
     events = db.relationship('Event', backref='group', lazy=True)
 
 class GroupMember(db.Model):
+    __table_args__ = (
+        db.Index('ix_group_member_group_user', 'group_id', 'user_id'),
+        db.Index('ix_group_member_user_group', 'user_id', 'group_id'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     group_id = db.Column(db.Integer, db.ForeignKey('group.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -38,15 +52,19 @@ class GroupMember(db.Model):
     joined_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class Event(db.Model):
+    __table_args__ = (
+        db.Index('ix_event_group_created', 'group_id', 'created_at'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text)
     event_type = db.Column(db.String(50), nullable=False)
     group_id = db.Column(db.Integer, db.ForeignKey('group.id'), nullable=False)
-    created_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    created_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     status = db.Column(db.String(20), default='planning')
     final_decision = db.Column(db.Integer, db.ForeignKey('event_option.id'))
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     scheduled_date = db.Column(db.DateTime)
     
     # Relationships
@@ -55,7 +73,7 @@ class Event(db.Model):
 
 class EventOption(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    event_id = db.Column(db.Integer, db.ForeignKey('event.id'), nullable=False)
+    event_id = db.Column(db.Integer, db.ForeignKey('event.id'), nullable=False, index=True)
     option_type = db.Column(db.String(50))
     title = db.Column(db.String(200))
     description = db.Column(db.Text)
@@ -67,16 +85,39 @@ class EventOption(db.Model):
 
 class Poll(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    event_id = db.Column(db.Integer, db.ForeignKey('event.id'), nullable=False)
+    event_id = db.Column(db.Integer, db.ForeignKey('event.id'), nullable=False, index=True)
     question = db.Column(db.String(300), nullable=False)
-    poll_type = db.Column(db.String(20), default='multiple')
+    poll_type = db.Column(db.String(20), default='multiple')  # 'single', 'multiple' or 'ranked'
 
 class Vote(db.Model):
+    __table_args__ = (
+        # A ballot has one row per chosen option; the (poll_id, user_id) prefix serves the "already voted" check
+        db.Index('uq_vote_poll_user_option', 'poll_id', 'user_id', 'option_id', unique=True),
+        # A poll's votes newer than a given id: vote_tally catching up on other workers' votes
+        db.Index('ix_vote_poll_id', 'poll_id', 'id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    poll_id = db.Column(db.Integer, db.ForeignKey('poll.id'), nullable=False)
+    option_id = db.Column(db.Integer, db.ForeignKey('event_option.id'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    vote_value = db.Column(db.Integer)  # rank (1 = first) on ranked polls, else 1
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class Ballot(db.Model):
+    """One row per (poll, voter), inserted in the same transaction as the ballot's Vote rows.
+
+    Vote is unique per option, so two concurrent ballots with different
+    options would both fit; this table's unique index lets only the first
+    one commit.
+    """
+    __table_args__ = (
+        db.Index('uq_ballot_poll_user', 'poll_id', 'user_id', unique=True),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     poll_id = db.Column(db.Integer, db.ForeignKey('poll.id'), nullable=False)
-    option_id = db.Column(db.Integer, db.ForeignKey('event_option.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    vote_value = db.Column(db.Integer)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class Enquiry(db.Model):
@@ -86,9 +127,192 @@ class Enquiry(db.Model):
     email = db.Column(db.String(120), nullable=False)
     year_of_birth = db.Column(db.Integer, nullable=False)
     message = db.Column(db.Text)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     status = db.Column(db.String(20), default='pending')
 
+# Group counter maintenance
+COUNTED_CHILDREN = {
+    'GroupMember': 'member_count',
+    'Event': 'event_count',
+}
+
+@event.listens_for(Session, 'after_flush')
+def _update_group_counters(session, flush_context):
+    """Apply member/event inserts and deletes to Group counters in the flush transaction"""
+    deltas = Counter()
+    for sign, objects in ((1, session.new), (-1, session.deleted)):
+        for obj in objects:
+            column = COUNTED_CHILDREN.get(type(obj).__name__)
+            if column and obj.group_id is not None:
+                deltas[(obj.group_id, column)] += sign
+
+    for (group_id, column), delta in deltas.items():
+        if delta == 0:
+            continue
+        session.connection().execute(
+            text(f'UPDATE "group" SET {column} = {column} + :delta WHERE id = :group_id'),
+            {'delta': delta, 'group_id': group_id}
+        )
+        session.info.setdefault('stale_group_counters', set()).add((group_id, column))
+
+@event.listens_for(Session, 'after_flush_postexec')
+def _expire_group_counters(session, flush_context):
+    """Reload counters changed by SQL so loaded Group objects do not report stale values"""
+    for group_id, column in session.info.pop('stale_group_counters', ()):
+        group = session.identity_map.get(session.identity_key(Group, group_id))
+        if group is not None:
+            session.expire(group, [column])
+
+def recount_group_counters():
+    """Recompute every Group counter from the child tables; returns the groups that had drifted"""
+    member_counts = dict(db.session.query(GroupMember.group_id, func.count(GroupMember.id))
+                         .group_by(GroupMember.group_id).all())
+    event_counts = dict(db.session.query(Event.group_id, func.count(Event.id))
+                        .group_by(Event.group_id).all())
+
+    repaired = []
+    for group in Group.query.all():
+        members = member_counts.get(group.id, 0)
+        events = event_counts.get(group.id, 0)
+        if group.member_count != members or group.event_count != events:
+            repaired.append((group.id, group.name, group.member_count, members, group.event_count, events))
+            group.member_count = members
+            group.event_count = events
+    db.session.commit()
+    return repaired
+
+def ensure_group_counter_columns():
+    """Add the counter columns to databases created before they existed, then backfill them"""
+    existing = {column['name'] for column in inspect(db.engine).get_columns('group')}
+    missing = [name for name in ('member_count', 'event_count') if name not in existing]
+    if not missing:
+        return False
+    with db.engine.begin() as conn:
+        for name in missing:
+            conn.execute(text(f'ALTER TABLE "group" ADD COLUMN {name} INTEGER NOT NULL DEFAULT 0'))
+    recount_group_counters()
+    return True
+
+# Indexes from earlier releases that the current schema replaces
+OBSOLETE_INDEXES = {
+    'vote': ['uq_vote_poll_user'],  # one vote per poll; ballots now hold several rows
+}
+
+def ensure_ballots():
+    """Backfill one Ballot per (poll, voter) for databases whose votes predate the table"""
+    if Ballot.query.first() is not None or Vote.query.first() is None:
+        return 0
+    # Plain INSERT ... SELECT ... WHERE NOT EXISTS so the backfill runs on any backend
+    created = db.session.execute(text(
+        'INSERT INTO ballot (poll_id, user_id, created_at) '
+        'SELECT v.poll_id, v.user_id, MIN(v.created_at) FROM vote v '
+        'WHERE NOT EXISTS (SELECT 1 FROM ballot b WHERE b.poll_id = v.poll_id AND b.user_id = v.user_id) '
+        'GROUP BY v.poll_id, v.user_id'
+    )).rowcount
+    db.session.commit()
+    return created
+
+def ensure_indexes(engine=None):
+    """Create any declared index missing from an existing database; returns the names created"""
+    engine = engine or db.engine
+    created = []
+    for table_name, names in OBSOLETE_INDEXES.items():
+        existing = {index['name'] for index in inspect(engine).get_indexes(table_name)}
+        for name in names:
+            if name in existing:
+                with engine.begin() as conn:
+                    conn.execute(text(f'DROP INDEX "{name}"'))
+    for table in db.metadata.sorted_tables:
+        existing = {index['name'] for index in inspect(engine).get_indexes(table.name)}
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            if index.name in existing:
+                continue
+            try:
+                index.create(bind=engine, checkfirst=True)
+                created.append(index.name)
+            except IntegrityError as e:
+                # Unique index over rows that already contain duplicates
+                print(f"⚠️ Could not create {index.name}: {e.orig}")
+    return created
+
+# SQLite connection tuning, configured through Config.SQLITE_*
+SQLITE_PRAGMAS = ('journal_mode', 'synchronous', 'busy_timeout', 'cache_size', 'mmap_size', 'temp_store')
+
+def sqlite_pragmas(config):
+    """PRAGMA name -> value for every SQLITE_<NAME> setting that is set"""
+    pragmas = {}
+    for name in SQLITE_PRAGMAS:
+        value = config.get(f'SQLITE_{name.upper()}')
+        if value not in (None, ''):
+            pragmas[name] = value
+    return pragmas
+
+def apply_sqlite_pragmas(dbapi_connection, pragmas):
+    """Run the PRAGMA statements on a raw sqlite3 connection"""
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+    finally:
+        cursor.close()
+
+def eventlet_patched():
+    """True once serve.py has monkey-patched the standard library with eventlet"""
+    patcher = sys.modules.get('eventlet.patcher')
+    return patcher is not None and patcher.is_monkey_patched('socket')
+
+_threaded_connection_class = None
+
+def connect_sqlite(*args, **kwargs):
+    """sqlite3.connect(); under eventlet every call on the connection runs in eventlet's thread pool.
+
+    sqlite3 releases the GIL but not the eventlet hub, so a busy_timeout wait
+    or a slow query on a green thread would stall every other connection of
+    the worker. Through eventlet.tpool it blocks one OS thread instead.
+    """
+    global _threaded_connection_class
+    if not eventlet_patched():
+        return sqlite3.connect(*args, **kwargs)
+    from eventlet import tpool
+    if _threaded_connection_class is None:
+        class ThreadedConnection(tpool.Proxy):
+            def __setattr__(self, name, value):
+                # Proxy only forwards reads; forward writes such as isolation_level too
+                if name.startswith('_'):
+                    object.__setattr__(self, name, value)
+                else:
+                    setattr(self._obj, name, value)
+        _threaded_connection_class = ThreadedConnection
+    # Calls arrive from tpool's worker threads, one at a time per connection
+    kwargs['check_same_thread'] = False
+    connection = tpool.execute(sqlite3.connect, *args, **kwargs)
+    return _threaded_connection_class(connection, autowrap=(sqlite3.Cursor,))
+
+def configure_sqlite(app):
+    """Apply the configured pragmas to every new connection of the app's SQLite engine"""
+    pragmas = sqlite_pragmas(app.config)
+    with app.app_context():
+        engine = db.engine
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'do_connect')
+    def _connect_sqlite(dialect, connection_record, cargs, cparams):
+        return connect_sqlite(*cargs, **cparams)
+
+    if not pragmas:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        apply_sqlite_pragmas(dbapi_connection, pragmas)
+
+def active_sqlite_pragmas(engine=None):
+    """Current value of each tuned pragma on a pooled connection"""
+    engine = engine or db.engine
+    with engine.connect() as conn:
+        return {name: conn.execute(text(f'PRAGMA {name}')).scalar() for name in SQLITE_PRAGMAS}
+
 def generate_random_password(length=12):
     characters = string.ascii_letters + string.digits + "!@#$%"
     return ''.join(random.choice(characters) for i in range(length))
@@ -4,77 +4,193 @@ Email tracking system for monitoring email delivery status
 """
 
 from database import db
-from datetime import datetime
+from datetime import datetime, timedelta
+from collections import Counter
+from sqlalchemy import case, func, select
+from config import Config
+import atexit
+import threading
 
 class EmailLog(db.Model):
+    __table_args__ = (
+        db.Index('ix_email_log_status_sent_at', 'status', 'sent_at'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     recipient_email = db.Column(db.String(120), nullable=False)
     subject = db.Column(db.String(200), nullable=False)
     email_type = db.Column(db.String(50), nullable=False)  # 'welcome', 'admin_notification', 'test'
     status = db.Column(db.String(20), nullable=False)  # 'sent', 'failed'
     error_message = db.Column(db.Text)
-    sent_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
 
+class EmailStatsHourly(db.Model):
+    """Per-hour sent/failed totals, kept in step with email_log by EmailLogWriter"""
+    hour = db.Column(db.DateTime, primary_key=True)  # start of the hour (UTC)
+    sent = db.Column(db.Integer, nullable=False, default=0)
+    failed = db.Column(db.Integer, nullable=False, default=0)
+
+def _hour(moment):
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+def add_to_hourly_stats(conn, rows):
+    """Fold email_log rows (dicts with sent_at/status) into email_stats_hourly on conn"""
+    counts = Counter((_hour(row['sent_at']), row['status']) for row in rows)
+    table = EmailStatsHourly.__table__
+    for hour in sorted({hour for hour, _ in counts}):
+        sent, failed = counts[(hour, 'sent')], counts[(hour, 'failed')]
+        updated = conn.execute(
+            table.update()
+            .where(table.c.hour == hour)
+            .values(sent=table.c.sent + sent, failed=table.c.failed + failed)
+        ).rowcount
+        if not updated:
+            conn.execute(table.insert().values(hour=hour, sent=sent, failed=failed))
+
+def rebuild_hourly_stats():
+    """Recompute email_stats_hourly from email_log; returns the number of hours written"""
+    EmailTracker.flush()
+    with db.engine.begin() as conn:
+        conn.execute(EmailStatsHourly.__table__.delete())
+        rows = conn.execute(select(EmailLog.sent_at, EmailLog.status)).mappings()
+        add_to_hourly_stats(conn, rows)
+        return conn.execute(select(func.count()).select_from(EmailStatsHourly.__table__)).scalar()
+
+def ensure_hourly_stats():
+    """Backfill the rollup once for databases that already hold email logs"""
+    if EmailStatsHourly.query.first() is None and EmailLog.query.first() is not None:
+        rebuild_hourly_stats()
+
+class EmailLogWriter:
+    """Buffers EmailLog rows and inserts them in batches on its own connection.
+
+    log() only appends to an in-memory buffer, so callers never wait on the
+    database and their session is left untouched. A background thread
+    writes the buffer, and its hourly rollup, in one transaction once batch_size rows are waiting
+    or flush_interval seconds have passed. flush() does the same on demand
+    and runs at interpreter exit.
+    """
+
+    def __init__(self, batch_size, flush_interval, max_buffered=10000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffered = max_buffered
+        self._rows = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._engine = None
+        self._thread = None
+
+    def log(self, **row):
+        row.setdefault('sent_at', datetime.utcnow())
+        with self._lock:
+            if self._engine is None:
+                # The first entry is logged inside an app context
+                self._engine = db.engine
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='email-log-writer', daemon=True)
+                self._thread.start()
+            self._rows.append(row)
+            pending = len(self._rows)
+        if pending >= self.batch_size:
+            self._wake.set()
+
+    def flush(self):
+        """Write every buffered row now; returns the number written"""
+        with self._flush_lock:
+            with self._lock:
+                rows, self._rows = self._rows, []
+            if not rows:
+                return 0
+            try:
+                with self._engine.begin() as conn:
+                    conn.execute(EmailLog.__table__.insert(), rows)
+                    add_to_hourly_stats(conn, rows)
+            except Exception as e:
+                print(f"Error writing {len(rows)} email logs: {e}")
+                with self._lock:
+                    # Keep them for the next flush, dropping the oldest beyond max_buffered
+                    self._rows[:0] = rows
+                    del self._rows[:-self.max_buffered]
+                return 0
+            return len(rows)
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+email_log_writer = EmailLogWriter(Config.EMAIL_LOG_BATCH_SIZE, Config.EMAIL_LOG_FLUSH_INTERVAL)
+atexit.register(email_log_writer.flush)
+
 class EmailTracker:
     @staticmethod
     def log_email_sent(recipient_email, subject, email_type, user_id=None):
-        """Log successful email sending"""
-        try:
-            email_log = EmailLog(
-                recipient_email=recipient_email,
-                subject=subject,
-                email_type=email_type,
-                status='sent',
-                user_id=user_id
-            )
-            db.session.add(email_log)
-            db.session.commit()
-            return email_log.id
-        except Exception as e:
-            print(f"Error logging email success: {e}")
-            return None
+        """Log successful email sending (buffered, see EmailLogWriter)"""
+        email_log_writer.log(
+            recipient_email=recipient_email,
+            subject=subject,
+            email_type=email_type,
+            status='sent',
+            error_message=None,
+            user_id=user_id
+        )
     
     @staticmethod
     def log_email_failed(recipient_email, subject, email_type, error_message, user_id=None):
-        """Log failed email sending"""
-        try:
-            email_log = EmailLog(
-                recipient_email=recipient_email,
-                subject=subject,
-                email_type=email_type,
-                status='failed',
-                error_message=str(error_message),
-                user_id=user_id
-            )
-            db.session.add(email_log)
-            db.session.commit()
-            return email_log.id
-        except Exception as e:
-            print(f"Error logging email failure: {e}")
-            return None
+        """Log failed email sending (buffered, see EmailLogWriter)"""
+        email_log_writer.log(
+            recipient_email=recipient_email,
+            subject=subject,
+            email_type=email_type,
+            status='failed',
+            error_message=str(error_message),
+            user_id=user_id
+        )
+    
+    @staticmethod
+    def flush():
+        """Write buffered log entries so the next query sees them"""
+        return email_log_writer.flush()
     
     @staticmethod
     def get_recent_emails(limit=50):
         """Get recent email logs"""
+        email_log_writer.flush()
         return EmailLog.query.order_by(EmailLog.sent_at.desc()).limit(limit).all()
     
     @staticmethod
     def get_email_stats():
-        """Get email statistics"""
-        total_emails = EmailLog.query.count()
-        sent_emails = EmailLog.query.filter_by(status='sent').count()
-        failed_emails = EmailLog.query.filter_by(status='failed').count()
+        """Get email statistics from the hourly rollup in a single query"""
+        email_log_writer.flush()
         
-        # Recent emails (last 24 hours)
-        from datetime import timedelta
-        yesterday = datetime.utcnow() - timedelta(days=1)
-        recent_emails = EmailLog.query.filter(EmailLog.sent_at >= yesterday).count()
+        # Last 24 hours: whole rollup hours after the cutoff, plus an exact
+        # count of the log rows between the cutoff and the next full hour
+        cutoff = datetime.utcnow() - timedelta(days=1)
+        first_full_hour = _hour(cutoff) + timedelta(hours=1)
+        partial_hour = (
+            select(func.count(EmailLog.id))
+            .where(EmailLog.sent_at >= cutoff, EmailLog.sent_at < first_full_hour)
+            .scalar_subquery()
+        )
+        sent_emails, failed_emails, recent_full_hours, recent_partial_hour = db.session.query(
+            func.coalesce(func.sum(EmailStatsHourly.sent), 0),
+            func.coalesce(func.sum(EmailStatsHourly.failed), 0),
+            func.coalesce(func.sum(case(
+                (EmailStatsHourly.hour >= first_full_hour, EmailStatsHourly.sent + EmailStatsHourly.failed),
+                else_=0
+            )), 0),
+            partial_hour
+        ).one()
+        total_emails = sent_emails + failed_emails
         
         return {
             'total': total_emails,
             'sent': sent_emails,
             'failed': failed_emails,
             'success_rate': (sent_emails / total_emails * 100) if total_emails > 0 else 0,
-            'recent_24h': recent_emails
-        }
\ No newline at end of file
+            'recent_24h': recent_full_hours + recent_partial_hour
+        }
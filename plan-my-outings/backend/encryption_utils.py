@@ -5,27 +5,39 @@ Encryption utilities for sensitive data
 
 import base64
 import os
+from functools import lru_cache
 from cryptography.fernet import Fernet
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 
+DEFAULT_SALT = b'plan_my_outings_salt_2025'  # Fixed salt for consistency
+KDF_ITERATIONS = 100000
+
+@lru_cache(maxsize=8)
+def derive_key(master_key, salt=DEFAULT_SALT):
+    """Derive the Fernet key for a master key and salt.
+
+    PBKDF2 with 100k iterations is deliberately slow, so the result is
+    cached per process and every PasswordEncryption built from the same
+    master key reuses it.
+    """
+    kdf = PBKDF2HMAC(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=salt,
+        iterations=KDF_ITERATIONS,
+    )
+    return base64.urlsafe_b64encode(kdf.derive(master_key.encode()))
+
 class PasswordEncryption:
-    def __init__(self, master_key=None):
+    def __init__(self, master_key=None, salt=DEFAULT_SALT):
         """Initialize encryption with a master key"""
         if master_key is None:
             # Use a combination of SECRET_KEY and a fixed salt for consistency
             master_key = os.getenv('SECRET_KEY', 'plan-my-outings-secret-key-2025')
         
-        # Create a key from the master key
-        salt = b'plan_my_outings_salt_2025'  # Fixed salt for consistency
-        kdf = PBKDF2HMAC(
-            algorithm=hashes.SHA256(),
-            length=32,
-            salt=salt,
-            iterations=100000,
-        )
-        key = base64.urlsafe_b64encode(kdf.derive(master_key.encode()))
-        self.cipher_suite = Fernet(key)
+        # Create a key from the master key (derived once per process)
+        self.cipher_suite = Fernet(derive_key(master_key, salt))
     
     def encrypt_password(self, password):
         """Encrypt a password"""
@@ -88,6 +100,30 @@ def decrypt_env_password(encrypted_password):
     
     return decrypted
 
+def decrypt_many(values):
+    """Decrypt several .env values in one pass.
+
+    Takes a dict of name -> value and returns a dict with the same keys.
+    Values without the 'ENC:' prefix (or None) are returned unchanged, and
+    the key derivation happens at most once for the whole batch. A value
+    that fails to decrypt becomes None without affecting the others.
+    """
+    encrypted = {name: value for name, value in values.items()
+                 if value and value.startswith('ENC:')}
+    if not encrypted:
+        return dict(values)
+    
+    encryptor = PasswordEncryption()
+    decrypted = dict(values)
+    for name, value in encrypted.items():
+        try:
+            decrypted[name] = encryptor.decrypt_password(value[4:])
+        except Exception as e:
+            print(f"Warning: Could not decrypt {name}: {e}")
+            decrypted[name] = None
+    
+    return decrypted
+
 if __name__ == "__main__":
     # Test the encryption
     encrypt_env_password()
\ No newline at end of file
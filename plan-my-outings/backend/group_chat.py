@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Group chat history
+
+Messages sent over Socket.IO are appended to chat_message in batches by
+ChatMessageWriter and broadcast once they have an id, so clients can page
+back through history (before_id) and catch up after a reconnect (since)
+with keyset queries on the (group_id, id) index.
+"""
+
+from database import db
+from datetime import datetime
+from sqlalchemy import select
+from config import Config
+import atexit
+import threading
+
+class ChatMessage(db.Model):
+    __table_args__ = (
+        # Every history query is a range scan on this index, newest or oldest first
+        db.Index('ix_chat_message_group_id', 'group_id', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    group_id = db.Column(db.Integer, db.ForeignKey('group.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+COLUMNS = ('group_id', 'user_id', 'body', 'created_at')
+
+def message_dict(row):
+    """JSON shape shared by the history endpoint and new_message broadcasts"""
+    return {
+        'id': row['id'],
+        'group_id': row['group_id'],
+        'user_id': row['user_id'],
+        'message': row['body'],
+        'sent_at': row['created_at'].isoformat()
+    }
+
+def history_query(group_id, before_id=None, since_id=None, limit=50):
+    """Keyset page of a group's messages: newest before before_id, or oldest after since_id"""
+    table = ChatMessage.__table__
+    query = select(table).where(table.c.group_id == group_id)
+    if since_id is not None:
+        return query.where(table.c.id > since_id).order_by(table.c.id).limit(limit)
+    if before_id is not None:
+        query = query.where(table.c.id < before_id)
+    return query.order_by(table.c.id.desc()).limit(limit)
+
+def load_history(group_id, before_id=None, since_id=None, limit=50):
+    """(messages oldest first, has_more) for one page of a group's history"""
+    chat_writer.flush()
+    rows = db.session.execute(history_query(group_id, before_id, since_id, limit + 1)).mappings().all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if since_id is None:
+        rows.reverse()
+    return [message_dict(row) for row in rows], has_more
+
+class ChatMessageWriter:
+    """Buffers chat messages and inserts them in batches on its own connection.
+
+    add() only appends to an in-memory buffer, so the send_message handler
+    never waits on the database. A background thread inserts the buffer in
+    one transaction once batch_size messages are waiting or flush_interval
+    seconds have passed, then hands the stored messages (with ids) to
+    on_written for broadcasting. flush() does the same on demand and runs
+    at interpreter exit.
+    """
+
+    def __init__(self, batch_size, flush_interval, max_buffered=10000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffered = max_buffered
+        self.on_written = None  # callback(list of stored message rows), set by socket_events
+        self._rows = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._engine = None
+        self._thread = None
+        self.written = self.batches = 0
+
+    def add(self, group_id, user_id, body, client_id=None):
+        row = {'group_id': group_id, 'user_id': user_id, 'body': body,
+               'created_at': datetime.utcnow(), 'client_id': client_id}
+        with self._lock:
+            if self._engine is None:
+                # The first message is added inside an app context
+                self._engine = db.engine
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='chat-message-writer', daemon=True)
+                self._thread.start()
+            self._rows.append(row)
+            pending = len(self._rows)
+        if pending >= self.batch_size:
+            self._wake.set()
+
+    def flush(self):
+        """Write every buffered message now; returns the number written"""
+        with self._flush_lock:
+            with self._lock:
+                rows, self._rows = self._rows, []
+            if not rows:
+                return 0
+            table = ChatMessage.__table__
+            try:
+                with self._engine.begin() as conn:
+                    # RETURNING in parameter order: ids need not be consecutive (other writers, other backends)
+                    ids = conn.execute(
+                        table.insert().returning(table.c.id, sort_by_parameter_order=True),
+                        [{column: row[column] for column in COLUMNS} for row in rows]
+                    ).scalars().all()
+            except Exception as e:
+                print(f"Error writing {len(rows)} chat messages: {e}")
+                with self._lock:
+                    # Keep them for the next flush, dropping the oldest beyond max_buffered
+                    self._rows[:0] = rows
+                    del self._rows[:-self.max_buffered]
+                return 0
+            for message_id, row in zip(ids, rows):
+                row['id'] = message_id
+            self.written += len(rows)
+            self.batches += 1
+            # Still under the flush lock, so batches are broadcast in id order
+            if self.on_written is not None:
+                try:
+                    self.on_written(rows)
+                except Exception as e:
+                    print(f"Error broadcasting {len(rows)} chat messages: {e}")
+            return len(rows)
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+chat_writer = ChatMessageWriter(Config.CHAT_BATCH_SIZE, Config.CHAT_FLUSH_INTERVAL)
+atexit.register(chat_writer.flush)
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Durable outbound mail queue
+
+Messages are stored in the outbound_email table in the same transaction as
+the change that triggered them, and sent later by a pool of background
+workers with retries and exponential backoff. EmailTracker records the
+final outcome of every message.
+
+Bodies can carry credentials (welcome mails include the generated
+password), so they are stored encrypted with PasswordEncryption and
+emptied once a row is sent or has permanently failed.
+"""
+
+import threading
+from datetime import datetime, timedelta
+from flask import current_app
+from flask_mail import Message
+from database import db
+from email_tracking import EmailTracker
+from encryption_utils import PasswordEncryption
+from config import Config
+
+class OutboundEmail(db.Model):
+    __table_args__ = (
+        db.Index('ix_outbound_email_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    recipient_email = db.Column(db.String(120), nullable=False)
+    subject = db.Column(db.String(200), nullable=False)
+    body = db.Column(db.Text, nullable=False)  # 'ENC:' + ciphertext until delivered, then ''
+    email_type = db.Column(db.String(50), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # 'pending', 'sending', 'sent', 'failed'
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+
+_body_cipher = PasswordEncryption()
+
+def seal_body(body):
+    """Encrypted form of a body for the queue; never falls back to storing the plain text"""
+    sealed = _body_cipher.encrypt_password(body)
+    if sealed is None:
+        raise ValueError('Could not encrypt the message body; not queueing it')
+    return 'ENC:' + sealed
+
+def open_body(stored):
+    """Plain text of a stored body (rows queued before encryption are plain already)"""
+    if not stored.startswith('ENC:'):
+        return stored
+    body = _body_cipher.decrypt_password(stored[4:])
+    if body is None:
+        raise ValueError('Could not decrypt the queued message body (was SECRET_KEY changed?)')
+    return body
+
+def clear_finished_bodies():
+    """Empty the bodies of rows that are already sent or failed; returns the number cleared"""
+    cleared = (
+        OutboundEmail.query
+        .filter(OutboundEmail.status.in_(('sent', 'failed')), OutboundEmail.body != '')
+        .update({'body': ''}, synchronize_session=False)
+    )
+    db.session.commit()
+    return cleared
+
+def enqueue_email(recipient_email, subject, body, email_type, user_id=None):
+    """Add a message to the current session; it is queued when the caller commits"""
+    email = OutboundEmail(
+        recipient_email=recipient_email,
+        subject=subject,
+        body=seal_body(body),
+        email_type=email_type,
+        user_id=user_id
+    )
+    db.session.add(email)
+    return email
+
+class MailQueue:
+    """Claims due rows from outbound_email and delivers them through a mailer.
+
+    The mailer is anything with send(message): flask_mail.Mail, or the
+    SMTPPool the app uses so workers reuse open connections.
+
+    A row moves pending -> sending -> sent, or back to pending with a later
+    next_attempt_at after a failure. After max_attempts failures it is
+    marked failed. Rows left in 'sending' by a crashed worker are retried
+    once they are older than claim_timeout seconds. Sent and failed rows
+    keep their metadata but not their body.
+    """
+
+    def __init__(self, workers, max_attempts, backoff, poll_interval, claim_timeout=300):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.poll_interval = poll_interval
+        self.claim_timeout = claim_timeout
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def _claim(self, now):
+        """Mark one due message as 'sending' for this worker and return it"""
+        stale = now - timedelta(seconds=self.claim_timeout)
+        candidates = (
+            OutboundEmail.query
+            .filter(db.or_(
+                db.and_(OutboundEmail.status == 'pending', OutboundEmail.next_attempt_at <= now),
+                db.and_(OutboundEmail.status == 'sending', OutboundEmail.next_attempt_at <= stale)
+            ))
+            .order_by(OutboundEmail.next_attempt_at)
+            .limit(self.workers * 2)
+            .all()
+        )
+        for email in candidates:
+            # Compare-and-set so two workers never send the same row
+            claimed = (
+                OutboundEmail.query
+                .filter_by(id=email.id, status=email.status, attempts=email.attempts)
+                .update({'status': 'sending', 'next_attempt_at': now}, synchronize_session=False)
+            )
+            db.session.commit()
+            if claimed:
+                return email
+        return None
+
+    def _deliver(self, mailer, email):
+        message = Message(
+            subject=email.subject,
+            sender=current_app.config['MAIL_USERNAME'],
+            recipients=[email.recipient_email]
+        )
+        message.body = open_body(email.body)
+        mailer.send(message)
+
+    def process_one(self, mailer):
+        """Send the next due message; returns False when nothing is due"""
+        now = datetime.utcnow()
+        email = self._claim(now)
+        if email is None:
+            return False
+
+        try:
+            self._deliver(mailer, email)
+        except Exception as e:
+            email.attempts += 1
+            email.last_error = str(e)
+            if email.attempts >= self.max_attempts:
+                email.status = 'failed'
+                email.body = ''
+                db.session.commit()
+                EmailTracker.log_email_failed(email.recipient_email, email.subject, email.email_type, e, email.user_id)
+            else:
+                email.status = 'pending'
+                email.next_attempt_at = now + timedelta(seconds=self.backoff * 2 ** (email.attempts - 1))
+                db.session.commit()
+            return True
+
+        email.attempts += 1
+        email.status = 'sent'
+        email.sent_at = datetime.utcnow()
+        email.body = ''
+        db.session.commit()
+        EmailTracker.log_email_sent(email.recipient_email, email.subject, email.email_type, email.user_id)
+        return True
+
+    def drain(self, app, mailer):
+        """Send everything currently due in the calling thread; returns the number processed"""
+        processed = 0
+        with app.app_context():
+            while self.process_one(mailer):
+                processed += 1
+        return processed
+
+    def wake(self):
+        """Tell idle workers that new rows were committed"""
+        self._wake.set()
+
+    def _run(self, app, mailer):
+        while not self._stop.is_set():
+            try:
+                with app.app_context():
+                    busy = self.process_one(mailer)
+            except Exception as e:
+                print(f"Mail queue worker error: {e}")
+                busy = False
+            if not busy:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def start(self, app, mailer):
+        """Start the background worker threads (idempotent)"""
+        if self._threads:
+            return
+        self._stop.clear()
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._run, args=(app, mailer), name=f'mail-queue-{index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+mail_queue = MailQueue(
+    Config.MAIL_QUEUE_WORKERS,
+    Config.MAIL_QUEUE_MAX_ATTEMPTS,
+    Config.MAIL_QUEUE_BACKOFF,
+    Config.MAIL_QUEUE_POLL_INTERVAL
+)
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Local movie catalog for TMDB autocomplete
+
+Every movie TMDB returns is added to an in-memory token index and appended
+to a compact on-disk log (one JSON array per line, no field names), so the
+catalog survives restarts. Prefix and token searches are answered locally.
+"""
+
+import bisect
+import json
+import os
+import re
+import threading
+
+# On-disk field order; each line is one movie as a JSON array
+FIELDS = ('id', 'title', 'release_date', 'rating', 'poster_path', 'overview')
+
+# Prefixes up to this length get their own id sets: they expand to too many tokens to union per query
+SHORT_PREFIX = 2
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+def tokenize(text):
+    return _TOKEN_RE.findall((text or '').lower())
+
+def short_prefixes(title):
+    """Every 1..SHORT_PREFIX character prefix of the title's tokens"""
+    return {token[:length] for token in set(tokenize(title)) for length in range(1, SHORT_PREFIX + 1)}
+
+class MovieCatalog:
+    """Token index over movie titles with prefix search.
+
+    _postings maps each title token to the ids containing it and _tokens
+    keeps the same tokens sorted, so every token starting with a prefix
+    is one bisect away. _short maps prefixes of up to SHORT_PREFIX
+    characters straight to ids. A query matches a movie when each complete
+    query token is a title token and the last (possibly partial) token is
+    a prefix of one; every case is answered from these sets, never by
+    scanning titles.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._movies = {}
+        self._postings = {}
+        self._tokens = []
+        self._short = {}  # short prefix -> ids
+        self._lock = threading.RLock()
+        if path and os.path.exists(path):
+            self.load()
+
+    def __len__(self):
+        return len(self._movies)
+
+    def _index(self, movie):
+        """Add one movie to the in-memory index; returns tokens not seen before"""
+        new_tokens = []
+        previous = self._movies.get(movie['id'])
+        if previous is not None:
+            for token in set(tokenize(previous['title'])):
+                self._postings[token].discard(movie['id'])
+            for prefix in short_prefixes(previous['title']):
+                self._short[prefix].discard(movie['id'])
+        self._movies[movie['id']] = movie
+        for prefix in short_prefixes(movie['title']):
+            self._short.setdefault(prefix, set()).add(movie['id'])
+        for token in set(tokenize(movie['title'])):
+            ids = self._postings.get(token)
+            if ids is None:
+                ids = self._postings[token] = set()
+                new_tokens.append(token)
+            ids.add(movie['id'])
+        return new_tokens
+
+    def _add_tokens(self, new_tokens):
+        if len(new_tokens) > 1000:
+            self._tokens = sorted(self._postings)
+        else:
+            for token in new_tokens:
+                bisect.insort(self._tokens, token)
+
+    def load(self):
+        """Rebuild the index from the on-disk log (later lines win)"""
+        with self._lock:
+            self._movies, self._postings, self._tokens, self._short = {}, {}, [], {}
+            with open(self.path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        self._index(dict(zip(FIELDS, json.loads(line))))
+                    except ValueError:
+                        continue  # torn final line from an interrupted write
+            self._tokens = sorted(self._postings)
+
+    def add_many(self, movies):
+        """Index movies and append the new or changed ones to the on-disk log"""
+        with self._lock:
+            changed = [movie for movie in movies if self._movies.get(movie['id']) != movie]
+            new_tokens = []
+            for movie in changed:
+                new_tokens.extend(self._index(movie))
+            self._add_tokens(new_tokens)
+            if changed and self.path:
+                self._append(changed)
+        return len(changed)
+
+    def _append(self, movies):
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                for movie in movies:
+                    f.write(json.dumps([movie.get(field) for field in FIELDS], separators=(',', ':')) + '\n')
+        except OSError as e:
+            print(f"Warning: Could not write movie catalog: {e}")
+
+    def compact(self):
+        """Rewrite the log with one line per movie"""
+        with self._lock:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for movie in self._movies.values():
+                    f.write(json.dumps([movie.get(field) for field in FIELDS], separators=(',', ':')) + '\n')
+            os.replace(tmp_path, self.path)
+
+    def _prefix_tokens(self, prefix):
+        tokens = self._tokens
+        for i in range(bisect.bisect_left(tokens, prefix), len(tokens)):
+            if not tokens[i].startswith(prefix):
+                break
+            yield tokens[i]
+
+    def search(self, query, limit=10):
+        """Movies whose title contains every query token, the last one as a prefix"""
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        *complete, prefix = tokens
+
+        with self._lock:
+            if complete:
+                postings = [self._postings.get(token, ()) for token in complete]
+                candidates = set(min(postings, key=len))
+                for ids in postings:
+                    candidates.intersection_update(ids)
+                if len(prefix) <= SHORT_PREFIX:
+                    prefix_ids = self._short.get(prefix, ())
+                else:
+                    prefix_ids = set().union(*(self._postings[token] for token in self._prefix_tokens(prefix)))
+                # Set intersection walks the smaller side
+                candidates.intersection_update(prefix_ids)
+                matches = list(candidates)
+            else:
+                # Single partial token: walk matching tokens until enough ids are found
+                matches = []
+                seen = set()
+                for token in self._prefix_tokens(prefix):
+                    for movie_id in self._postings[token]:
+                        if movie_id not in seen:
+                            seen.add(movie_id)
+                            matches.append(movie_id)
+                    if len(matches) >= limit * 5:
+                        break
+
+            # Rank a bounded sample so very common tokens stay cheap
+            movies = [self._movies[movie_id] for movie_id in matches[:limit * 5]]
+
+        # Titles that start with the query first, then by rating
+        normalized = ' '.join(tokens)
+        movies.sort(key=lambda movie: (not ' '.join(tokenize(movie['title'])).startswith(normalized),
+                                       -(movie.get('rating') or 0)))
+        return movies[:limit]
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Poll result computation
+
+A poll's votes are read in one query ordered by voter and rank, as plain
+column tuples rather than ORM objects, and merged into (ranking, weight)
+pairs, one per distinct ballot. Every method counts those pairs, so 100k ballots over a
+handful of options reduce to a few hundred distinct rankings.
+
+Methods: plurality (first preferences), approval (every option on the
+ballot), borda and irv (ranked). Only ranked polls carry an order, so borda
+and irv need one, and a multiple-choice ballot has no first preference.
+"""
+
+import threading
+from collections import Counter, OrderedDict
+from itertools import groupby
+from operator import itemgetter
+from sqlalchemy import func, select
+from database import db, Event, Poll, Vote
+from vote_tally import vote_tally
+
+METHODS = ('plurality', 'approval', 'borda', 'irv')
+DEFAULT_METHODS = {'single': 'plurality', 'multiple': 'approval', 'ranked': 'irv'}
+ALLOWED_METHODS = {'single': ('plurality', 'approval'), 'multiple': ('approval',), 'ranked': METHODS}
+
+def load_ballots(poll_id):
+    """Counter of ranking tuples -> number of voters who cast exactly that ranking"""
+    # A Core select on the session's connection skips per-row ORM loading;
+    # unranked votes share rank 1 and fall back to option order
+    rows = db.session.connection().execute(
+        select(Vote.user_id, Vote.option_id)
+        .where(Vote.poll_id == poll_id)
+        .order_by(Vote.user_id, func.coalesce(Vote.vote_value, 1), Vote.option_id)
+    ).fetchall()
+    ballots = Counter()
+    for _, votes in groupby(rows, key=itemgetter(0)):
+        ballots[tuple(map(itemgetter(1), votes))] += 1
+    return ballots
+
+def _winner(scores):
+    """Highest score; ties go to the lowest option id so results are stable"""
+    if not scores:
+        return None
+    return min(scores, key=lambda option_id: (-scores[option_id], option_id))
+
+def count_plurality(ballots, candidates):
+    """One point for each ballot's first preference"""
+    scores = dict.fromkeys(candidates, 0)
+    for ranking, weight in ballots.items():
+        if ranking:
+            scores[ranking[0]] = scores.get(ranking[0], 0) + weight
+    return {'scores': scores, 'winner': _winner(scores)}
+
+def count_approval(ballots, candidates):
+    """One point for every option on a ballot"""
+    scores = dict.fromkeys(candidates, 0)
+    for ranking, weight in ballots.items():
+        for option_id in ranking:
+            scores[option_id] = scores.get(option_id, 0) + weight
+    return {'scores': scores, 'winner': _winner(scores)}
+
+def count_borda(ballots, candidates):
+    """n-1 points for a first preference down to 0 for last; unranked options score 0"""
+    n = len(candidates)
+    scores = dict.fromkeys(candidates, 0)
+    for ranking, weight in ballots.items():
+        for position, option_id in enumerate(ranking):
+            scores[option_id] = scores.get(option_id, 0) + (n - 1 - position) * weight
+    return {'scores': scores, 'winner': _winner(scores)}
+
+def count_irv(ballots, candidates):
+    """Instant runoff: drop the last-placed option until one has a majority of live ballots"""
+    remaining = set(candidates)
+    for ranking in ballots:
+        remaining.update(ranking)
+    # Each distinct ranking sits in the pile of its highest remaining preference
+    piles = {option_id: [] for option_id in remaining}
+    for ranking, weight in ballots.items():
+        if ranking:
+            piles[ranking[0]].append((ranking, 0, weight))
+
+    rounds = []
+    while remaining:
+        tallies = {option_id: sum(weight for _, _, weight in piles[option_id]) for option_id in remaining}
+        rounds.append(tallies)
+        live = sum(tallies.values())
+        leader = _winner(tallies)
+        if len(remaining) == 1 or tallies[leader] * 2 > live:
+            return {'scores': tallies, 'winner': leader if live else None, 'rounds': rounds}
+
+        # Eliminate the lowest (ties: the highest option id) and transfer its ballots
+        loser = max(remaining, key=lambda option_id: (-tallies[option_id], option_id))
+        remaining.discard(loser)
+        for ranking, position, weight in piles.pop(loser):
+            for next_position in range(position + 1, len(ranking)):
+                if ranking[next_position] in remaining:
+                    piles[ranking[next_position]].append((ranking, next_position, weight))
+                    break
+            # else: ballot exhausted
+    return {'scores': {}, 'winner': None, 'rounds': rounds}
+
+def poll_is_closed(poll_id):
+    """A poll closes when its event has been decided"""
+    status = (
+        db.session.query(Event.status)
+        .join(Poll, Poll.event_id == Event.id)
+        .filter(Poll.id == poll_id)
+        .scalar()
+    )
+    return status == 'decided'
+
+COUNTERS = {'plurality': count_plurality, 'approval': count_approval, 'borda': count_borda, 'irv': count_irv}
+
+def compute(method, ballots, candidates=()):
+    """Result of `method` over merged ballots"""
+    result = COUNTERS[method](ballots, candidates)
+    result['ballots'] = sum(ballots.values())
+    result['method'] = method
+    return result
+
+class _PollEntry:
+    def __init__(self, watermark, ballots):
+        self.watermark = watermark
+        self.ballots = ballots
+        self.results = {}  # (method, candidates) -> result
+
+class PollResults:
+    """Merged ballots and computed results per poll, kept until the poll gets a new vote.
+
+    Freshness is checked against vote_tally's watermark for the poll, so a
+    cached result costs no query while nobody votes, and every method of a
+    poll shares one read of its votes. The watermark only covers votes
+    counted by this process, so anything that must see every worker's
+    votes (closing a poll) passes fresh=True to read them from the database.
+    """
+
+    def __init__(self, max_polls=1000):
+        self.max_polls = max_polls
+        self._polls = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get(self, poll, method=None, candidates=(), fresh=False):
+        poll_type = poll.poll_type or 'multiple'
+        method = method or DEFAULT_METHODS.get(poll_type, 'plurality')
+        if method not in METHODS:
+            raise ValueError(f"Unknown method '{method}' (expected one of {', '.join(METHODS)})")
+        if method not in ALLOWED_METHODS.get(poll_type, METHODS):
+            raise ValueError(f"Method '{method}' does not apply to {poll_type} polls")
+        # Options can be added to a live poll, so they are part of the key
+        key = (method, tuple(sorted(candidates)))
+        watermark = vote_tally.watermark(poll.id)
+        with self._lock:
+            entry = self._polls.get(poll.id)
+            if not fresh and entry is not None and entry.watermark == watermark:
+                self._polls.move_to_end(poll.id)
+                if key in entry.results:
+                    self.hits += 1
+                    return entry.results[key]
+            else:
+                entry = None
+            self.misses += 1
+
+        if entry is None:
+            entry = _PollEntry(watermark, load_ballots(poll.id))
+        result = entry.results[key] = compute(method, entry.ballots, key[1])
+        with self._lock:
+            self._polls[poll.id] = entry
+            self._polls.move_to_end(poll.id)
+            while len(self._polls) > self.max_polls:
+                self._polls.popitem(last=False)
+        return result
+
+poll_results = PollResults()
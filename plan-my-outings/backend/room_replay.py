@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Room broadcast replay
+
+Room broadcasts that clients cannot rebuild from a later message
+(new_event, vote_update, decision_made) carry a per-room sequence number
+and are kept in a bounded buffer per room. A reconnecting client sends the
+last sequence number it saw and gets only what it missed, or is told to
+reload a full snapshot when the buffer no longer reaches back that far.
+
+RoomReplay keeps the buffers in memory; its sequence numbers belong to one
+server process (`epoch`), so after a restart the client reloads a snapshot.
+Behind a message queue a room's broadcasts come from every worker and a
+resync may land on any of them, so SharedRoomReplay keeps the buffers in
+the app database instead and every worker answers from the same rows.
+"""
+
+import json
+import threading
+import time
+import uuid
+from collections import deque, OrderedDict
+from sqlalchemy import func, select
+from database import db
+from config import Config
+
+class RoomBroadcast(db.Model):
+    """A stamped room broadcast, shared by every worker (SharedRoomReplay)"""
+    __tablename__ = 'room_broadcast'
+    __table_args__ = (
+        db.Index('ix_room_broadcast_room', 'room', 'id'),
+        {'sqlite_autoincrement': True},  # ids are sequence numbers and must never be reused
+    )
+
+    id = db.Column(db.Integer, primary_key=True)  # the broadcast's sequence number
+    room = db.Column(db.String(64), nullable=False)
+    prev_id = db.Column(db.Integer, nullable=False)  # the room's previous broadcast, 0 for its first
+    event = db.Column(db.String(64), nullable=False)
+    data = db.Column(db.Text, nullable=False)  # JSON, without room/seq/epoch
+    created_at = db.Column(db.Float, nullable=False)  # time.time()
+
+class _RoomLog:
+    def __init__(self, seq, size):
+        self.seq = seq  # sequence number of the room's latest broadcast
+        self.events = deque(maxlen=size)  # (seq, event, data), oldest first
+        self.lock = threading.Lock()  # held while stamping and emitting, so one room's order holds
+
+class RoomReplay:
+    """Per-room sequence numbers and the last `size` broadcasts of each room.
+
+    At most `max_rooms` rooms are kept; the least recently used are dropped.
+    A room (re)created after that starts above every sequence number issued
+    so far, so a client holding an older number sees a gap and reloads
+    instead of silently missing the dropped broadcasts.
+
+    The shared lock only guards the room table; each room has its own lock
+    for stamping and emitting, so a slow emit holds up that room alone.
+    """
+
+    def __init__(self, size, max_rooms):
+        self.size = size
+        self.max_rooms = max_rooms
+        self.epoch = uuid.uuid4().hex[:12]
+        self._rooms = OrderedDict()
+        self._issued = 0  # broadcasts stamped in any room
+        self._lock = threading.Lock()
+        self.replays = self.resets = 0
+
+    def _log(self, room):
+        """The room's log, creating it if needed (caller holds the lock)"""
+        log = self._rooms.get(room)
+        if log is None:
+            log = self._rooms[room] = _RoomLog(self._issued, self.size)
+            while len(self._rooms) > self.max_rooms:
+                self._rooms.popitem(last=False)
+        self._rooms.move_to_end(room)
+        return log
+
+    def broadcast(self, socketio, event, data, room):
+        """Emit `data` to a room with the room's next sequence number and keep it for replay"""
+        with self._lock:
+            log = self._log(room)
+            self._issued += 1
+        with log.lock:
+            # Stamp and emit under the room's lock so its broadcasts leave in sequence order
+            log.seq += 1
+            data = dict(data, room=room, seq=log.seq, epoch=self.epoch)
+            log.events.append((log.seq, event, data))
+            socketio.emit(event, data, room=room)
+
+    def since(self, room, epoch, seq):
+        """(missed broadcasts as [{seq, event, data}] or None if a snapshot is needed, room's current seq)"""
+        with self._lock:
+            log = self._log(room)
+        with log.lock:
+            if seq is None:
+                return [], log.seq  # first subscription: nothing to catch up on
+            oldest = log.events[0][0] if log.events else log.seq + 1
+            if epoch != self.epoch or seq > log.seq or seq + 1 < oldest:
+                self.resets += 1
+                return None, log.seq
+            self.replays += 1
+            return [{'seq': number, 'event': event, 'data': data}
+                    for number, event, data in log.events if number > seq], log.seq
+
+    def stats(self):
+        return {
+            'rooms': len(self._rooms),
+            'replays': self.replays,
+            'resets': self.resets
+        }
+
+class SharedRoomReplay:
+    """Room replay kept in the app database, for several workers behind a message queue.
+
+    A broadcast's sequence number is the id of the row it is stored in, so
+    numbers only go up whichever worker stamps them and any worker can answer
+    a resync. Each row points at the room's previous broadcast (prev_id): a
+    client's position is covered when the first row after it points back at
+    it. Rooms keep their last `size` rows; rows older than `retention`
+    seconds are pruned. bind() must be called with the app's engine, since
+    vote broadcasts are emitted from background tasks without an app context.
+    """
+
+    epoch = 'shared'  # row ids outlive restarts, so every worker and restart shares one epoch
+
+    def __init__(self, size, retention, lock_stripes=64):
+        self.size = size
+        self.retention = retention
+        self._engine = None
+        # Insert and emit under the room's lock so this worker's broadcasts leave in sequence order
+        self._room_locks = [threading.Lock() for _ in range(lock_stripes)]
+        self._lock = threading.Lock()
+        self.broadcasts = self.replays = self.resets = 0
+
+    def bind(self, engine):
+        self._engine = engine
+
+    def _stamp(self, conn, event, data, room):
+        """Store a broadcast; returns its sequence number"""
+        table = RoomBroadcast.__table__
+        now = time.time()
+        previous = select(func.coalesce(func.max(table.c.id), 0)).where(table.c.room == room).scalar_subquery()
+        seq = conn.execute(
+            table.insert().values(room=room, prev_id=previous, event=event,
+                                  data=json.dumps(data), created_at=now).returning(table.c.id)
+        ).scalar_one()
+        # Keep the room's newest `size` rows
+        cutoff = (select(table.c.id).where(table.c.room == room)
+                  .order_by(table.c.id.desc()).offset(self.size).limit(1).scalar_subquery())
+        conn.execute(table.delete().where(table.c.room == room, table.c.id <= cutoff))
+        if seq % 500 == 0:
+            conn.execute(table.delete().where(table.c.created_at < now - self.retention))
+        return seq
+
+    def broadcast(self, socketio, event, data, room):
+        """Emit `data` to a room with its stored sequence number"""
+        with self._room_locks[hash(room) % len(self._room_locks)]:
+            try:
+                with self._engine.begin() as conn:
+                    seq = self._stamp(conn, event, data, room)
+            except Exception as e:
+                # Deliver it anyway; clients that miss it resync from a snapshot
+                print(f"Error storing {event} broadcast for {room}: {e}")
+                socketio.emit(event, data, room=room)
+                return
+            with self._lock:
+                self.broadcasts += 1
+            socketio.emit(event, dict(data, room=room, seq=seq, epoch=self.epoch), room=room)
+
+    def since(self, room, epoch, seq):
+        """(missed broadcasts as [{seq, event, data}] or None if a snapshot is needed, room's current seq)"""
+        table = RoomBroadcast.__table__
+        latest = select(func.coalesce(func.max(table.c.id), 0)).where(table.c.room == room)
+        with self._engine.connect() as conn:
+            if seq is None:
+                return [], conn.execute(latest).scalar()  # first subscription: nothing to catch up on
+            rows = conn.execute(
+                select(table.c.id, table.c.prev_id, table.c.event, table.c.data)
+                .where(table.c.room == room, table.c.id > seq).order_by(table.c.id)
+            ).fetchall() if epoch == self.epoch else []
+            current = rows[-1].id if rows else conn.execute(latest).scalar()
+        # Rows between the client's position and the oldest kept one were pruned (or it is from another database)
+        if epoch != self.epoch or seq > current or (rows and rows[0].prev_id != seq):
+            with self._lock:
+                self.resets += 1
+            return None, current
+        with self._lock:
+            self.replays += 1
+        return [{'seq': row.id, 'event': row.event,
+                 'data': dict(json.loads(row.data), room=room, seq=row.id, epoch=self.epoch)}
+                for row in rows], current
+
+    def stats(self):
+        return {
+            'broadcasts': self.broadcasts,
+            'replays': self.replays,
+            'resets': self.resets
+        }
+
+if Config.SOCKETIO_MESSAGE_QUEUE:
+    room_replay = SharedRoomReplay(Config.REPLAY_BUFFER_SIZE, Config.REPLAY_RETENTION)
+else:
+    room_replay = RoomReplay(Config.REPLAY_BUFFER_SIZE, Config.REPLAY_MAX_ROOMS)
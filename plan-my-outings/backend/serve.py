@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Production server for Plan My Outings
+
+Runs the Flask app and the Socket.IO handlers on cooperative workers
+(SOCKETIO_ASYNC_MODE=eventlet, the default here, or gevent) instead of the
+threaded development server that `python app.py` starts. Each websocket
+is a green thread rather than an OS thread.
+
+The standard library is monkey-patched before the app is imported.
+Sockets used by requests (api_services) and smtplib (smtp_pool, mail
+queue) then yield to other green threads while waiting, and the mail
+queue, email log writer and suggestion pool threads become green threads.
+SQLite calls, which no monkey-patch can make cooperative, run in eventlet's
+thread pool (database.connect_sqlite).
+"""
+
+import os
+from dotenv import load_dotenv
+
+# .env may choose the async mode, so it is read before anything is patched
+load_dotenv()
+ASYNC_MODE = os.environ.setdefault('SOCKETIO_ASYNC_MODE', 'eventlet')
+if ASYNC_MODE == 'eventlet':
+    import eventlet
+    eventlet.monkey_patch()
+elif ASYNC_MODE == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+
+from app import app, socketio, smtp_pool, prepare_database
+from mail_queue import mail_queue
+from config import Config
+
+def lean_http_protocol():
+    """eventlet's HTTP handler with small stream buffers.
+
+    Every connection keeps its handler's read and write buffers (8 KB and
+    16 KB by default) for its whole life, websockets included, although a
+    websocket never uses them after the upgrade. Requests and responses
+    larger than 1 KB bypass the buffers anyway.
+    """
+    import eventlet.wsgi
+
+    class LeanHttpProtocol(eventlet.wsgi.HttpProtocol):
+        rbufsize = 1024
+        wbufsize = 1024
+
+    return LeanHttpProtocol
+
+def main():
+    prepare_database()
+    mail_queue.start(app, smtp_pool)
+    options = {}
+    if socketio.async_mode == 'eventlet':
+        # eventlet.wsgi caps concurrent connections at 1024 by default
+        options['max_size'] = Config.SERVER_MAX_CONNECTIONS
+        options['protocol'] = lean_http_protocol()
+    print(f"🚀 Serving Plan My Outings on {Config.SERVER_HOST}:{Config.SERVER_PORT} ({socketio.async_mode})")
+    socketio.run(app, host=Config.SERVER_HOST, port=Config.SERVER_PORT, **options)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Pooled SMTP connections for flask_mail
+
+Opening a flask_mail connection costs a TCP connect, STARTTLS and a login.
+SMTPPool keeps a few authenticated connections open and reuses them for
+later messages, and send_many() delivers a batch over a single connection.
+"""
+
+import queue
+import smtplib
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Errors that mean the socket is gone and a fresh connection may succeed
+DISCONNECT_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, ConnectionError, TimeoutError)
+
+class SMTPPool:
+    """Up to `size` open flask_mail connections shared between threads.
+
+    An idle connection is closed instead of reused once it has been idle
+    for more than `max_idle` seconds. Otherwise it is checked with NOOP
+    before being handed out. A send that fails because the server dropped
+    the socket is retried once on a new connection.
+    """
+
+    def __init__(self, mail, size, max_idle):
+        self.mail = mail
+        self.size = size
+        self.max_idle = max_idle
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self.opened = 0  # connections opened since start, for diagnostics
+
+    def _open(self):
+        connection = self.mail.connect()
+        connection.__enter__()
+        self.opened += 1
+        return connection
+
+    @staticmethod
+    def _close(connection):
+        try:
+            connection.__exit__(None, None, None)
+        except Exception:
+            pass
+
+    def _is_alive(self, connection, idle_since):
+        if time.monotonic() - idle_since > self.max_idle:
+            return False
+        if connection.host is None:
+            return True  # MAIL_SUPPRESS_SEND: nothing to check
+        try:
+            return connection.host.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def _checkout(self):
+        while True:
+            try:
+                connection, idle_since = self._idle.get_nowait()
+            except queue.Empty:
+                return self._open()
+            if self._is_alive(connection, idle_since):
+                return connection
+            self._close(connection)
+
+    @contextmanager
+    def connection(self):
+        """Borrow an open connection; it returns to the pool unless it broke"""
+        self._slots.acquire()
+        connection = None
+        try:
+            connection = self._checkout()
+            yield connection
+        except DISCONNECT_ERRORS:
+            if connection is not None:
+                self._close(connection)
+                connection = None
+            raise
+        finally:
+            if connection is not None:
+                self._idle.put((connection, time.monotonic()))
+            self._slots.release()
+
+    def send(self, message):
+        """Send one message on a pooled connection"""
+        try:
+            with self.connection() as connection:
+                connection.send(message)
+        except DISCONNECT_ERRORS:
+            with self.connection() as connection:
+                connection.send(message)
+
+    def send_many(self, messages):
+        """Send a batch over one connection; returns an error (or None) per message"""
+        errors = []
+        pending = deque(messages)
+        reconnected = False
+        while pending:
+            try:
+                with self.connection() as connection:
+                    while pending:
+                        try:
+                            connection.send(pending[0])
+                            errors.append(None)
+                        except DISCONNECT_ERRORS:
+                            raise
+                        except Exception as e:
+                            # Rejected recipient etc.; the connection is still usable
+                            errors.append(e)
+                        pending.popleft()
+                        reconnected = False
+            except DISCONNECT_ERRORS as e:
+                if reconnected:
+                    # Dropped again straight after reconnecting: fail the rest of the batch
+                    errors.extend(e for _ in pending)
+                    break
+                reconnected = True
+        return errors
+
+    def close_all(self):
+        """Close every idle connection (e.g. after the mail settings changed)"""
+        while True:
+            try:
+                connection, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._close(connection)
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Cross-process Socket.IO broadcasts
+
+With several backend workers, an emit to a room must reach clients that
+are connected to the other workers too. python-socketio does this with a
+client manager that publishes every emit on a shared bus and has each
+worker deliver the messages it reads back to its own clients.
+
+Config.SOCKETIO_MESSAGE_QUEUE selects the bus:
+  (unset)                single process, no bus
+  sqlite:///path/bus.db  SQLiteBusManager below; workers on one host, no broker needed
+  redis://... amqp://... handed to Flask-SocketIO's own queue managers
+
+Only emits travel over the bus. State the workers must agree on is kept
+in the app database instead when a bus is configured:
+  vote_tally    each read adds the votes other workers committed since
+  room_replay   SharedRoomReplay: broadcasts stored in room_broadcast
+  presence      SharedPresence: every worker's room members in socket_presence
+VoteBroadcaster still coalesces per worker; its versions are vote ids, so
+clients order snapshots from different workers correctly.
+"""
+
+import pickle
+import sqlite3
+import threading
+import time
+import socketio
+from database import connect_sqlite
+
+class SQLiteBusManager(socketio.PubSubManager):
+    """Socket.IO pub/sub over a table in a local SQLite file.
+
+    Publishing inserts a row. Every worker's listener polls for rows with a
+    higher id than it has already seen. SQLite serializes writers, so ids
+    follow commit order and no message is skipped. Rows older than
+    `retention` seconds are pruned by publishers.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, url, channel='flask-socketio', write_only=False, logger=None,
+                 poll_interval=0.02, retention=60):
+        self.path = url[len('sqlite:///'):] if url.startswith('sqlite:///') else url
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._published = 0
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        # One connection for publishing (shared, under a lock) and one for the listener;
+        # not per thread, since under eventlet/gevent every greenlet is a "thread"
+        self._publisher = self._connect()
+        self._publish_lock = threading.Lock()
+        self._publisher.execute(
+            'CREATE TABLE IF NOT EXISTS socketio_bus ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, channel TEXT NOT NULL, '
+            'payload BLOB NOT NULL, created_at REAL NOT NULL)'
+        )
+
+    def _connect(self):
+        # Under eventlet the bus's polling and inserts run in tpool threads, off the hub
+        connection = connect_sqlite(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+        connection.execute('PRAGMA journal_mode = WAL')
+        connection.execute('PRAGMA synchronous = NORMAL')
+        return connection
+
+    def _publish(self, data):
+        now = time.time()
+        payload = pickle.dumps(data)
+        with self._publish_lock:
+            self._publisher.execute('INSERT INTO socketio_bus (channel, payload, created_at) VALUES (?, ?, ?)',
+                                    (self.channel, payload, now))
+            self._published += 1
+            if self._published % 500 == 0:
+                self._publisher.execute('DELETE FROM socketio_bus WHERE created_at < ?', (now - self.retention,))
+
+    def _sleep(self, seconds):
+        server = getattr(self, 'server', None)
+        (server.sleep if server is not None else time.sleep)(seconds)
+
+    def _listen(self):
+        connection = self._connect()
+        # Only messages published after this worker started listening
+        last_id = connection.execute('SELECT COALESCE(MAX(id), 0) FROM socketio_bus').fetchone()[0]
+        while True:
+            try:
+                rows = connection.execute(
+                    'SELECT id, channel, payload FROM socketio_bus WHERE id > ? ORDER BY id', (last_id,)
+                ).fetchall()
+            except sqlite3.OperationalError as e:
+                print(f"Socket bus read failed, retrying: {e}")
+                rows = []
+            for message_id, channel, payload in rows:
+                last_id = message_id
+                if channel == self.channel:
+                    yield pickle.loads(payload)
+            if not rows:
+                self._sleep(self.poll_interval)
+
+def message_queue_options(url, channel='flask-socketio'):
+    """SocketIO() keyword arguments for the configured message queue"""
+    if not url:
+        return {}
+    if url.startswith('sqlite:'):
+        return {'client_manager': SQLiteBusManager(url, channel=channel)}
+    return {'message_queue': url, 'channel': channel}
@@ -1,65 +1,351 @@
+from flask import request
 from flask_socketio import SocketIO, emit, join_room, leave_room
-from database import db, User, Group, Event, Vote, EventOption
+from database import db, User, Group, GroupMember, Event, Poll, Vote, Ballot, EventOption
+from sqlalchemy.exc import IntegrityError
+from vote_tally import vote_tally
+from poll_results import poll_is_closed
+from config import Config
+from socket_bus import message_queue_options
+from socket_registry import connection_registry, SharedPresence
+from auth import user_id_from_token
+from group_chat import chat_writer, message_dict
+from room_replay import room_replay
 import json
+import threading
 
-socketio = SocketIO(cors_allowed_origins="*")
+# With SOCKETIO_MESSAGE_QUEUE set, room emits reach clients on every worker
+socketio = SocketIO(cors_allowed_origins="*", async_mode=Config.SOCKETIO_ASYNC_MODE,
+                    **message_queue_options(Config.SOCKETIO_MESSAGE_QUEUE, Config.SOCKETIO_CHANNEL))
+
+class VoteBroadcaster:
+    """Coalesces vote_update broadcasts per poll.
+
+    mark() only notes that a poll changed. At most once per `window`
+    seconds each changed poll gets one vote_update carrying its full
+    counts. Its version is the highest vote id counted, which only goes
+    up and means the same thing after a restart or on another worker,
+    so clients can drop snapshots that arrive out of order.
+    """
+
+    def __init__(self, socketio, window):
+        self.socketio = socketio
+        self.window = window
+        self._dirty = set()
+        self._scheduled = False
+        self._lock = threading.Lock()
+        self.marked = self.emitted = 0
+
+    def mark(self, poll_id):
+        with self._lock:
+            self.marked += 1
+            self._dirty.add(poll_id)
+            if self._scheduled:
+                return
+            self._scheduled = True
+        self.socketio.start_background_task(self._flush_after_window)
+
+    def _flush_after_window(self):
+        self.socketio.sleep(self.window)
+        self.flush()
+
+    def flush(self):
+        """Emit one snapshot for every poll changed since the last flush"""
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            self._scheduled = False
+        for poll_id in dirty:
+            snapshot = vote_tally.cached_snapshot(poll_id)
+            if snapshot is None:
+                continue  # evicted; the next vote reloads it and marks it again
+            counts, version = snapshot
+            with self._lock:
+                self.emitted += 1
+            room_replay.broadcast(self.socketio, 'vote_update', {
+                'poll_id': poll_id,
+                'version': version,
+                'counts': counts,
+                'total_votes': sum(counts.values())
+            }, f'poll_{poll_id}')
+
+vote_broadcaster = VoteBroadcaster(socketio, Config.VOTE_BROADCAST_WINDOW)
+
+def group_id_of(room):
+    """7 for 'group_7'"""
+    group_id = room[len('group_'):]
+    return int(group_id) if group_id.isdigit() else group_id
+
+class PresenceBroadcaster:
+    """Coalesces presence_update broadcasts per group room.
+
+    Joins, leaves and disconnects only mark the room; at most once per
+    `window` seconds each marked room gets one presence_update with the
+    user ids currently online, so a reconnect storm costs one emit per
+    group instead of one per socket.
+
+    With `shared` (a SharedPresence, behind a message queue) a flush first
+    publishes this worker's members of the room, and "online" merges every
+    worker's; a background heartbeat keeps this worker's rows fresh.
+    """
+
+    def __init__(self, socketio, registry, window, shared=None):
+        self.socketio = socketio
+        self.registry = registry
+        self.window = window
+        self.shared = shared
+        self._dirty = set()
+        self._scheduled = False
+        self._heartbeat_started = False
+        self._lock = threading.Lock()
+        self.marked = self.emitted = 0
+
+    def mark(self, room):
+        with self._lock:
+            self.marked += 1
+            self._dirty.add(room)
+            if self._scheduled:
+                return
+            self._scheduled = True
+            start_heartbeat = self.shared is not None and not self._heartbeat_started
+            self._heartbeat_started = self._heartbeat_started or start_heartbeat
+        self.socketio.start_background_task(self._flush_after_window)
+        if start_heartbeat:
+            self.socketio.start_background_task(self._heartbeat)
+
+    def _heartbeat(self):
+        while True:
+            self.socketio.sleep(self.shared.heartbeat_interval)
+            try:
+                self.shared.heartbeat()
+            except Exception as e:
+                print(f"Presence heartbeat failed: {e}")
+
+    def online(self, room):
+        """Sorted user ids online in a room (on every worker when shared)"""
+        if self.shared is not None:
+            return self.shared.online(room)
+        return sorted(self.registry.members(room))
+
+    def _flush_after_window(self):
+        self.socketio.sleep(self.window)
+        self.flush()
+
+    def flush(self):
+        """Emit the online users of every room marked since the last flush"""
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            self._scheduled = False
+        for room in dirty:
+            try:
+                if self.shared is not None:
+                    self.shared.publish(room)
+                online = self.online(room)
+            except Exception as e:
+                print(f"Error publishing presence for {room}: {e}")
+                continue
+            with self._lock:
+                self.emitted += 1
+            self.socketio.emit('presence_update', {
+                'group_id': group_id_of(room),
+                'online': online,
+                'online_count': len(online)
+            }, room=room)
+
+# Each worker's registry only knows its own sockets; behind a message queue they are merged in the database
+presence_broadcaster = PresenceBroadcaster(
+    socketio, connection_registry, Config.PRESENCE_BROADCAST_WINDOW,
+    shared=SharedPresence(connection_registry, Config.PRESENCE_HEARTBEAT, Config.PRESENCE_STALE_SECONDS)
+    if Config.SOCKETIO_MESSAGE_QUEUE else None)
+
+def parse_id(value):
+    """Positive int id from client data, or None"""
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return None
+    return value if value > 0 else None
+
+def room_group_id(room):
+    """Id of the group a group_/poll_/event_ room belongs to, or None"""
+    kind, _, key = room.partition('_')
+    key = parse_id(key) if key.isdigit() else None
+    if key is None:
+        return None
+    if kind == 'group':
+        return key
+    if kind == 'event':
+        return db.session.query(Event.group_id).filter(Event.id == key).scalar()
+    if kind == 'poll':
+        return (db.session.query(Event.group_id).join(Poll, Poll.event_id == Event.id)
+                .filter(Poll.id == key).scalar())
+    return None
+
+def can_access_group(user_id, group_id):
+    """Same rule as the REST endpoints: group members and the superadmin"""
+    if user_id is None or group_id is None:
+        return False
+    if GroupMember.query.filter_by(group_id=group_id, user_id=user_id).first():
+        return True
+    user = db.session.get(User, user_id)
+    return user is not None and user.username == 'superadmin'
 
 @socketio.on('connect')
-def handle_connect():
-    print('Client connected')
+def handle_connect(auth=None):
+    # socket.io-client sends the login token as io(url, { auth: { token } })
+    token = (auth or {}).get('token') or request.args.get('token')
+    connection_registry.connect(request.sid, user_id_from_token(token))
 
 @socketio.on('disconnect')
 def handle_disconnect():
-    print('Client disconnected')
+    for room in connection_registry.disconnect(request.sid):
+        presence_broadcaster.mark(room)
 
 @socketio.on('join_group')
 def handle_join_group(data):
-    group_id = data.get('group_id')
+    group_id = parse_id(data.get('group_id'))
+    if not can_access_group(connection_registry.user_id(request.sid), group_id):
+        emit('room_error', {'room': f"group_{data.get('group_id')}", 'message': 'You are not a member of this group'})
+        return
     join_room(f'group_{group_id}')
-    emit('user_joined', {'message': 'A user joined the group'}, room=f'group_{group_id}')
+    if connection_registry.join(request.sid, f'group_{group_id}'):
+        presence_broadcaster.mark(f'group_{group_id}')
 
 @socketio.on('leave_group')
 def handle_leave_group(data):
-    group_id = data.get('group_id')
+    group_id = parse_id(data.get('group_id'))
+    if group_id is None:
+        return
     leave_room(f'group_{group_id}')
-    emit('user_left', {'message': 'A user left the group'}, room=f'group_{group_id}')
+    if connection_registry.leave(request.sid, f'group_{group_id}'):
+        presence_broadcaster.mark(f'group_{group_id}')
 
 @socketio.on('create_event')
 def handle_create_event(data):
-    group_id = data.get('group_id')
+    group_id = parse_id(data.get('group_id'))
     event_data = data.get('event_data')
-    emit('new_event', {'event': event_data}, room=f'group_{group_id}')
+    # Broadcasts are kept for replay, so only members may put one in the group's room
+    if not can_access_group(connection_registry.user_id(request.sid), group_id):
+        emit('room_error', {'room': f"group_{data.get('group_id')}", 'message': 'You are not a member of this group'})
+        return
+    room_replay.broadcast(socketio, 'new_event', {'event': event_data}, f'group_{group_id}')
 
 @socketio.on('cast_vote')
 def handle_cast_vote(data):
-    poll_id = data.get('poll_id')
-    option_id = data.get('option_id')
-    user_id = data.get('user_id')
+    poll_id = parse_id(data.get('poll_id'))
+    option_id = parse_id(data.get('option_id'))
+    # The voter is whoever authenticated this socket, never a user_id from the payload
+    user_id = connection_registry.user_id(request.sid)
+    
+    if user_id is None or poll_id is None or not can_access_group(user_id, room_group_id(f'poll_{poll_id}')):
+        emit('vote_error', {'poll_id': data.get('poll_id'), 'message': 'You are not a member of this group'})
+        return
+    option_in_poll = (
+        db.session.query(EventOption.id)
+        .join(Poll, Poll.event_id == EventOption.event_id)
+        .filter(Poll.id == poll_id, EventOption.id == option_id)
+        .scalar()
+    )
+    if option_in_poll is None:
+        emit('vote_error', {'poll_id': poll_id, 'message': 'Invalid option for this poll'})
+        return
+    if poll_is_closed(poll_id):
+        emit('vote_error', {'poll_id': poll_id, 'message': 'This poll is closed'})
+        return
+    if Vote.query.filter_by(poll_id=poll_id, user_id=user_id).first():
+        emit('vote_error', {'poll_id': poll_id, 'message': 'You have already voted!'})
+        return
     
     # Save vote to database
     vote = Vote(poll_id=poll_id, option_id=option_id, user_id=user_id)
-    db.session.add(vote)
-    db.session.commit()
+    db.session.add_all([Ballot(poll_id=poll_id, user_id=user_id), vote])
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        emit('vote_error', {'poll_id': poll_id, 'message': 'You have already voted!'})
+        return
     
-    # Get updated vote counts
-    option = EventOption.query.get(option_id)
-    vote_count = len(option.votes)
-    
-    emit('vote_update', {
-        'poll_id': poll_id,
-        'option_id': option_id,
-        'vote_count': vote_count,
-        'user_id': user_id
-    }, room=f'poll_{poll_id}')
+    # Update the tally; the room gets the new counts with the next coalesced snapshot
+    vote_tally.record(vote)
+    vote_broadcaster.mark(poll_id)
+
+def broadcast_messages(rows):
+    """chat_writer.on_written: each stored message goes to its group with its id"""
+    for row in rows:
+        socketio.emit('new_message', dict(message_dict(row), client_id=row['client_id']),
+                      room=f"group_{row['group_id']}")
+
+chat_writer.on_written = broadcast_messages
 
 @socketio.on('send_message')
 def handle_send_message(data):
-    group_id = data.get('group_id')
+    group_id = parse_id(data.get('group_id'))
     message_data = data.get('message')
-    emit('new_message', {'message': message_data}, room=f'group_{group_id}')
+    user_id = connection_registry.user_id(request.sid)
+    
+    if user_id is None or group_id is None or not connection_registry.is_present(user_id, f'group_{group_id}'):
+        emit('message_error', {'group_id': data.get('group_id'), 'message': 'Join the group before sending messages'})
+        return
+    if not isinstance(message_data, str) or not message_data.strip() or len(message_data) > Config.CHAT_MESSAGE_MAX_LENGTH:
+        emit('message_error', {'group_id': group_id, 'message': f'Messages must be 1-{Config.CHAT_MESSAGE_MAX_LENGTH} characters'})
+        return
+    # Membership may have been revoked since the join
+    if not can_access_group(user_id, group_id):
+        emit('message_error', {'group_id': group_id, 'message': 'You are not a member of this group'})
+        return
+    
+    # Stored, then broadcast with its id, by the chat writer within CHAT_FLUSH_INTERVAL
+    chat_writer.add(group_id, user_id, message_data, client_id=data.get('client_id'))
 
 @socketio.on('event_decision')
 def handle_event_decision(data):
-    event_id = data.get('event_id')
+    event_id = parse_id(data.get('event_id'))
     decision_data = data.get('decision')
-    emit('decision_made', {'decision': decision_data}, room=f'event_{event_id}')
+    room = f'event_{event_id}'
+    if not can_access_group(connection_registry.user_id(request.sid), room_group_id(room)):
+        emit('room_error', {'room': f"event_{data.get('event_id')}", 'message': 'You are not a member of this group'})
+        return
+    room_replay.broadcast(socketio, 'decision_made', {'decision': decision_data}, room)
+
+REPLAYED_ROOMS = ('group_', 'poll_', 'event_')
+
+@socketio.on('unsubscribe')
+def handle_unsubscribe(data):
+    """Leave a room the client no longer shows, so its broadcasts stop arriving"""
+    room = data.get('room')
+    if not isinstance(room, str) or not room.startswith(REPLAYED_ROOMS):
+        return
+    leave_room(room)
+    if room.startswith('group_') and connection_registry.leave(request.sid, room):
+        presence_broadcaster.mark(room)
+
+@socketio.on('resync')
+def handle_resync(data):
+    """Rejoin rooms after a reconnect and replay what was missed.
+
+    data: {'rooms': {room: {'epoch': ..., 'seq': last seen}}}; seq None just subscribes.
+    Each room gets one 'replay' with the missed broadcasts in order, or
+    snapshot_required when they are no longer buffered. Rooms of groups
+    the user is not a member of get a 'room_error' instead.
+    """
+    user_id = connection_registry.user_id(request.sid)
+    for room, seen in (data.get('rooms') or {}).items():
+        if not room.startswith(REPLAYED_ROOMS):
+            continue
+        if not can_access_group(user_id, room_group_id(room)):
+            emit('room_error', {'room': room, 'message': 'You are not a member of this group'})
+            continue
+        seen = seen or {}
+        epoch, seq = seen.get('epoch'), seen.get('seq')
+        if seq is not None and not isinstance(seq, int):
+            epoch, seq = None, 0  # unreadable position: send a snapshot
+        join_room(room)
+        if room.startswith('group_') and connection_registry.join(request.sid, room):
+            presence_broadcaster.mark(room)
+        events, current = room_replay.since(room, epoch, seq)
+        emit('replay', {
+            'room': room,
+            'epoch': room_replay.epoch,
+            'seq': current,
+            'events': events or [],
+            'snapshot_required': events is None
+        })
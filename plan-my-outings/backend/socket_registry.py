@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Socket.IO connection registry
+
+Tracks which user each connection (sid) belongs to and which rooms it has
+joined, so "who is online in group_7" is a dict lookup instead of a scan
+over every socket. A user with several tabs open is one member of a room
+until their last connection leaves it.
+
+The registry is per process. With several workers behind a message queue
+each worker knows only its own connections, so SharedPresence publishes
+every worker's room members to a table in the app database and reads the
+other workers' rows back when reporting who is online.
+"""
+
+import threading
+import time
+import uuid
+from sqlalchemy import select
+from database import db
+
+class SocketPresence(db.Model):
+    """A user present in a room through one worker's connections (SharedPresence)"""
+    __tablename__ = 'socket_presence'
+    __table_args__ = (
+        db.Index('ix_socket_presence_room', 'room', 'seen_at'),
+    )
+
+    worker = db.Column(db.String(32), primary_key=True)
+    room = db.Column(db.String(64), primary_key=True)
+    user_id = db.Column(db.Integer, primary_key=True)
+    seen_at = db.Column(db.Float, nullable=False)  # time.time() of the worker's last heartbeat
+
+class _Connection:
+    __slots__ = ('user_id', 'rooms')
+
+    def __init__(self, user_id):
+        self.user_id = user_id  # None for connections without a valid token
+        self.rooms = set()
+
+class ConnectionRegistry:
+    """sid <-> user_id <-> rooms, all lookups O(1).
+
+    Rooms map to {user_id: open connections in the room}; a user is
+    present while that count is above zero. Entries are deleted as soon
+    as they empty, so memory follows the live connections.
+    """
+
+    def __init__(self):
+        self._connections = {}  # sid -> _Connection
+        self._user_sids = {}  # user_id -> {sid}
+        self._rooms = {}  # room -> {user_id: connections}
+        self._lock = threading.Lock()
+
+    def connect(self, sid, user_id):
+        with self._lock:
+            self._connections[sid] = _Connection(user_id)
+            if user_id is not None:
+                self._user_sids.setdefault(user_id, set()).add(sid)
+
+    def user_id(self, sid):
+        connection = self._connections.get(sid)
+        return connection.user_id if connection is not None else None
+
+    def join(self, sid, room):
+        """Add a connection to a room; True if its user was not present there before"""
+        with self._lock:
+            connection = self._connections.get(sid)
+            if connection is None or connection.user_id is None or room in connection.rooms:
+                return False
+            connection.rooms.add(room)
+            members = self._rooms.setdefault(room, {})
+            members[connection.user_id] = members.get(connection.user_id, 0) + 1
+            return members[connection.user_id] == 1
+
+    def _leave(self, connection, room):
+        """Remove a connection from a room (caller holds the lock); True if its user left the room"""
+        connection.rooms.discard(room)
+        members = self._rooms[room]
+        remaining = members[connection.user_id] - 1
+        if remaining:
+            members[connection.user_id] = remaining
+            return False
+        del members[connection.user_id]
+        if not members:
+            del self._rooms[room]
+        return True
+
+    def leave(self, sid, room):
+        """Remove a connection from a room; True if its user is no longer present there"""
+        with self._lock:
+            connection = self._connections.get(sid)
+            if connection is None or room not in connection.rooms:
+                return False
+            return self._leave(connection, room)
+
+    def disconnect(self, sid):
+        """Forget a connection; returns the rooms its user is no longer present in"""
+        with self._lock:
+            connection = self._connections.pop(sid, None)
+            if connection is None:
+                return []
+            if connection.user_id is not None:
+                sids = self._user_sids[connection.user_id]
+                sids.discard(sid)
+                if not sids:
+                    del self._user_sids[connection.user_id]
+            return [room for room in list(connection.rooms) if self._leave(connection, room)]
+
+    def members(self, room):
+        """User ids present in a room"""
+        with self._lock:
+            return list(self._rooms.get(room, ()))
+
+    def member_count(self, room):
+        return len(self._rooms.get(room, ()))
+
+    def is_present(self, user_id, room):
+        return user_id in self._rooms.get(room, ())
+
+    def is_online(self, user_id):
+        return user_id in self._user_sids
+
+    def stats(self):
+        return {
+            'connections': len(self._connections),
+            'users': len(self._user_sids),
+            'rooms': len(self._rooms)
+        }
+
+class SharedPresence:
+    """Room members of every worker, through the socket_presence table.
+
+    Each worker owns its rows: publish() replaces them for a room from the
+    local registry, and heartbeat() keeps them fresh. Rows not refreshed
+    for `stale_seconds` belong to a worker that stopped and are ignored.
+    bind() must be called with the app's engine, since presence is flushed
+    from a background task without an app context.
+    """
+
+    def __init__(self, registry, heartbeat, stale_seconds):
+        self.registry = registry
+        self.heartbeat_interval = heartbeat
+        self.stale_seconds = stale_seconds
+        self.worker = uuid.uuid4().hex
+        self._engine = None
+        self.published = 0
+
+    def bind(self, engine):
+        self._engine = engine
+
+    def publish(self, room):
+        """Replace this worker's rows for a room with its current local members"""
+        table = SocketPresence.__table__
+        now = time.time()
+        members = self.registry.members(room)
+        with self._engine.begin() as conn:
+            conn.execute(table.delete().where(table.c.worker == self.worker, table.c.room == room))
+            if members:
+                conn.execute(table.insert(), [{'worker': self.worker, 'room': room, 'user_id': user_id, 'seen_at': now}
+                                              for user_id in members])
+        self.published += 1
+
+    def online(self, room):
+        """Sorted user ids present in a room on any live worker"""
+        table = SocketPresence.__table__
+        with self._engine.connect() as conn:
+            others = conn.execute(
+                select(table.c.user_id).distinct()
+                .where(table.c.room == room, table.c.worker != self.worker,
+                       table.c.seen_at >= time.time() - self.stale_seconds)
+            ).scalars().all()
+        # This worker's own members come from the registry, which is never behind its rows
+        return sorted(set(others).union(self.registry.members(room)))
+
+    def heartbeat(self):
+        table = SocketPresence.__table__
+        with self._engine.begin() as conn:
+            conn.execute(table.update().where(table.c.worker == self.worker).values(seen_at=time.time()))
+
+connection_registry = ConnectionRegistry()
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+In-memory vote tallies
+
+Per-poll vote counts are loaded with one GROUP BY the first time a poll is
+used and then kept up to date as votes are committed, so reporting a count
+after a vote never reloads the poll's Vote rows. Behind a message queue
+other workers commit votes too; each read then adds the poll's rows newer
+than the tally has seen (an index range on (poll_id, id)) instead of
+recounting.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import func
+from database import db, Vote
+from config import Config
+
+class _PollTally:
+    def __init__(self, counts, loaded_through):
+        self.counts = counts  # option_id -> votes
+        self.loaded_through = loaded_through  # highest vote id the load counted
+        self.last_vote_id = loaded_through  # highest vote id counted so far
+        self.recorded = set()  # shared mode: ids above loaded_through counted via record()
+        self.loaded_at = time.monotonic()
+
+class _Load:
+    """A GROUP BY in progress that concurrent readers of the same poll wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.tally = None
+        self.error = None
+        self.recorded = []  # votes counted while the query ran; it may have missed them
+
+class VoteTally:
+    """Vote counts per (poll, option) shared by the REST API and Socket.IO.
+
+    Counts are re-read from the database after `ttl` seconds so deletes
+    made elsewhere (cli_admin, another process) are picked up. With
+    `shared` (several workers behind a message queue) every read of a
+    cached poll also catches up on votes other workers committed since. At
+    most `max_polls` polls are kept; the least recently used are dropped.
+
+    The GROUP BY runs outside the lock, once per poll however many readers
+    are waiting for it, so a slow load never stalls other polls' votes.
+    """
+
+    def __init__(self, max_polls, ttl, shared=False):
+        self.max_polls = max_polls
+        self.ttl = ttl
+        self.shared = shared
+        self._polls = OrderedDict()
+        self._loading = {}  # poll_id -> _Load
+        self._lock = threading.Lock()
+        self.loads = self.catch_ups = 0
+
+    def _load(self, poll_id):
+        rows = (
+            db.session.query(Vote.option_id, func.count(Vote.id), func.max(Vote.id))
+            .filter(Vote.poll_id == poll_id)
+            .group_by(Vote.option_id)
+            .all()
+        )
+        return _PollTally({option_id: count for option_id, count, _ in rows},
+                          max((last for _, _, last in rows), default=0))
+
+    def _tally(self, poll_id):
+        """The poll's tally, loading it if missing or expired (caller must not hold the lock)"""
+        with self._lock:
+            tally = self._polls.get(poll_id)
+            fresh = tally is not None and time.monotonic() - tally.loaded_at <= self.ttl
+            if fresh:
+                self._polls.move_to_end(poll_id)
+            else:
+                load = self._loading.get(poll_id)
+                leader = load is None
+                if leader:
+                    load = self._loading[poll_id] = _Load()
+                    self.loads += 1
+
+        if fresh:
+            if self.shared:
+                self._catch_up(poll_id, tally)
+            return tally
+
+        if not leader:
+            load.done.wait()
+            if load.error is not None:
+                raise load.error
+            return load.tally
+
+        try:
+            load.tally = self._load(poll_id)
+        except Exception as e:
+            load.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._loading[poll_id]
+                if load.error is None:
+                    for vote in load.recorded:
+                        self._add(load.tally, vote)
+                    self._polls[poll_id] = load.tally
+                    self._polls.move_to_end(poll_id)
+                    while len(self._polls) > self.max_polls:
+                        self._polls.popitem(last=False)
+            load.done.set()
+        return load.tally
+
+    def counts(self, poll_id):
+        """{option_id: votes} for a poll"""
+        tally = self._tally(poll_id)
+        with self._lock:
+            return dict(tally.counts)
+
+    def _add(self, tally, vote):
+        """Count a vote unless the tally already has it (caller holds the lock)"""
+        # A tally loaded after this vote was committed already includes it
+        if vote.id <= tally.loaded_through or vote.id in tally.recorded:
+            return
+        tally.counts[vote.option_id] = tally.counts.get(vote.option_id, 0) + 1
+        tally.last_vote_id = max(tally.last_vote_id, vote.id)
+        if self.shared:
+            # A later catch-up reads it back from the table; it must not count it twice
+            tally.recorded.add(vote.id)
+
+    def _catch_up(self, poll_id, tally):
+        """Count the poll's votes committed since the tally last read the table (shared mode)"""
+        rows = (
+            db.session.query(Vote.id, Vote.option_id)
+            .filter(Vote.poll_id == poll_id, Vote.id > tally.loaded_through)
+            .order_by(Vote.id)
+            .all()
+        )
+        with self._lock:
+            self.catch_ups += 1
+            if not rows:
+                return
+            # Another catch-up may have applied some of these already; ids above
+            # loaded_through are the ones it has not
+            for vote_id, option_id in rows:
+                if vote_id > tally.loaded_through and vote_id not in tally.recorded:
+                    tally.counts[option_id] = tally.counts.get(option_id, 0) + 1
+            tally.loaded_through = max(tally.loaded_through, rows[-1][0])
+            tally.last_vote_id = max(tally.last_vote_id, tally.loaded_through)
+            tally.recorded = {vote_id for vote_id in tally.recorded if vote_id > tally.loaded_through}
+
+    def _count(self, vote, tally):
+        """Add one committed vote (caller holds the lock); returns its option's total.
+
+        `tally` is what _tally() returned; if the poll was evicted since, the
+        vote only goes there, and the next load reads it from the database.
+        """
+        tally = self._polls.get(vote.poll_id, tally)
+        self._add(tally, vote)
+        load = self._loading.get(vote.poll_id)
+        if load is not None:
+            load.recorded.append(vote)
+        return tally.counts.get(vote.option_id, 0)
+
+    def record(self, vote):
+        """Count a committed vote; returns the new total for its option"""
+        tally = self._tally(vote.poll_id)
+        with self._lock:
+            return self._count(vote, tally)
+
+    def record_many(self, votes):
+        """Count committed votes (anything with id, poll_id and option_id, e.g. result rows)"""
+        votes = list(votes)
+        tallies = {poll_id: self._tally(poll_id) for poll_id in {vote.poll_id for vote in votes}}
+        with self._lock:
+            for vote in votes:
+                self._count(vote, tallies[vote.poll_id])
+
+    def watermark(self, poll_id):
+        """(total votes, highest vote id) for a poll; changes whenever a vote is counted"""
+        tally = self._tally(poll_id)
+        with self._lock:
+            return sum(tally.counts.values()), tally.last_vote_id
+
+    def cached_snapshot(self, poll_id):
+        """({option_id: votes}, highest vote id) if the poll is in memory, else None (never queries)"""
+        with self._lock:
+            tally = self._polls.get(poll_id)
+            return (dict(tally.counts), tally.last_vote_id) if tally is not None else None
+
+    def forget(self, poll_id=None):
+        """Drop one poll's tally (or all of them) after votes were deleted"""
+        with self._lock:
+            if poll_id is None:
+                self._polls.clear()
+            else:
+                self._polls.pop(poll_id, None)
+
+# Behind a message queue other workers commit votes too; reads catch up on them
+vote_tally = VoteTally(Config.VOTE_TALLY_POLLS, Config.VOTE_TALLY_TTL, shared=bool(Config.SOCKETIO_MESSAGE_QUEUE))
@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { pollsAPI } from '../services/api';
 import SocketService from '../services/socket';
 
@@ -7,6 +7,7 @@ const EmojiVotingSystem = ({ poll, currentUser, onVoteUpdate }) => {
   const [voteCounts, setVoteCounts] = useState({});
   const [emojiReactions, setEmojiReactions] = useState({});
   const [loading, setLoading] = useState(false);
+  const lastVersion = useRef(0);
 
   // Emoji options for voting
   const emojiOptions = {
@@ -18,6 +19,11 @@ const EmojiVotingSystem = ({ poll, currentUser, onVoteUpdate }) => {
     maybe: { emoji: '🤔', label: 'Maybe...' }
   };
 
+  useEffect(() => {
+    // Versions are vote ids of one poll; start over when the poll changes
+    lastVersion.current = 0;
+  }, [poll.id]);
+
   useEffect(() => {
     // Initialize vote counts
     if (poll && poll.options) {
@@ -30,9 +36,11 @@ const EmojiVotingSystem = ({ poll, currentUser, onVoteUpdate }) => {
 
     // Listen for real-time vote updates
     SocketService.onEvent('vote_update', (data) => {
+      if (data.poll_id !== poll.id || data.version <= lastVersion.current) return;
+      lastVersion.current = data.version;
       setVoteCounts(prev => ({
         ...prev,
-        [data.option_id]: data.vote_count
+        ...data.counts
       }));
       
       if (onVoteUpdate) {
@@ -50,9 +58,19 @@ const EmojiVotingSystem = ({ poll, currentUser, onVoteUpdate }) => {
       }));
     });
 
+    // Missed too many updates while disconnected: reload the counts
+    SocketService.onEvent('resync_snapshot', async ({ room }) => {
+      if (room !== `poll_${poll.id}`) return;
+      const response = await pollsAPI.getResults(poll.id);
+      setVoteCounts(Object.fromEntries(response.data.results.map((r) => [r.option_id, r.vote_count])));
+    });
+    SocketService.subscribe(`poll_${poll.id}`);
+
     return () => {
       SocketService.offEvent('vote_update');
       SocketService.offEvent('emoji_reaction');
+      SocketService.offEvent('resync_snapshot');
+      SocketService.unsubscribe(`poll_${poll.id}`);
     };
   }, [poll, onVoteUpdate]);
 
@@ -80,7 +98,7 @@ const EmojiVotingSystem = ({ poll, currentUser, onVoteUpdate }) => {
         });
       }
       
-      SocketService.castVote(poll.id, optionId, currentUser.id);
+      SocketService.castVote(poll.id, optionId);
     } catch (error) {
       console.error('Error casting vote:', error);
       alert('Error casting vote. Please try again.');
@@ -1,30 +1,42 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { pollsAPI } from '../services/api';
 import SocketService from '../services/socket';
 
 const VotingSystem = ({ poll, currentUser }) => {
   const [selectedOption, setSelectedOption] = useState(null);
   const [voteCounts, setVoteCounts] = useState({});
+  const lastVersion = useRef(0);
 
   useEffect(() => {
+    // Versions are vote ids of this poll; start over when the poll changes
+    lastVersion.current = 0;
+    // Snapshots carry every option's count; ignore ones older than what we have
     SocketService.onEvent('vote_update', (data) => {
-      setVoteCounts(prev => ({
-        ...prev,
-        [data.option_id]: data.vote_count
-      }));
+      if (data.poll_id !== poll.id || data.version <= lastVersion.current) return;
+      lastVersion.current = data.version;
+      setVoteCounts(data.counts);
     });
+    // Missed too many updates while disconnected: reload the counts
+    SocketService.onEvent('resync_snapshot', async ({ room }) => {
+      if (room !== `poll_${poll.id}`) return;
+      const response = await pollsAPI.getResults(poll.id);
+      setVoteCounts(Object.fromEntries(response.data.results.map((r) => [r.option_id, r.vote_count])));
+    });
+    SocketService.subscribe(`poll_${poll.id}`);
 
     return () => {
       SocketService.offEvent('vote_update');
+      SocketService.offEvent('resync_snapshot');
+      SocketService.unsubscribe(`poll_${poll.id}`);
     };
-  }, []);
+  }, [poll.id]);
 
   const castVote = async (optionId) => {
     try {
       await pollsAPI.castVote(poll.id, { option_id: optionId });
       setSelectedOption(optionId);
       
-      SocketService.castVote(poll.id, optionId, currentUser.id);
+      SocketService.castVote(poll.id, optionId);
     } catch (error) {
       alert('Error casting vote');
     }
@@ -26,10 +26,15 @@ export const contactAPI = {
 export const groupsAPI = {
   getGroups: () => api.get('/groups'),
   createGroup: (data) => api.post('/groups', data),
+  getPresence: (groupId) => api.get(`/groups/${groupId}/presence`),
+  // params: { before_id, limit } to page back, { since } to catch up after a reconnect
+  getMessages: (groupId, params) => api.get(`/groups/${groupId}/messages`, { params }),
 };
 
 export const eventsAPI = {
   createEvent: (data) => api.post('/events', data),
+  getSuggestions: (eventId, params) =>
+    api.get(`/events/${eventId}/suggestions`, { params }),
 };
 
 export const placesAPI = {
@@ -50,6 +55,10 @@ export const weatherAPI = {
 export const pollsAPI = {
   castVote: (pollId, data) => 
     api.post(`/polls/${pollId}/vote`, data),
+  submitBallot: (pollId, ballot) =>
+    api.post(`/polls/${pollId}/ballot`, ballot),
+  getResults: (pollId, method) =>
+    api.get(`/polls/${pollId}/results`, { params: { method } }),
 };
 
 export const adminAPI = {
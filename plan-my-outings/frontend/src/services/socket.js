@@ -5,13 +5,61 @@ const SOCKET_URL = process.env.REACT_APP_SOCKET_URL || 'http://localhost:5000';
 class SocketService {
   constructor() {
     this.socket = null;
+    // room -> { epoch, seq } of the last broadcast seen, replayed from on reconnect
+    this.rooms = {};
   }
 
   connect() {
-    this.socket = io(SOCKET_URL);
+    // The token identifies this connection for group presence
+    this.socket = io(SOCKET_URL, { auth: { token: localStorage.getItem('token') } });
+    this.socket.onAny((event, data) => {
+      const seen = data && data.seq !== undefined && this.rooms[data.room];
+      // Broadcasts stamped by different workers can arrive out of order; keep the highest
+      if (seen && (seen.epoch !== data.epoch || seen.seq === null || data.seq > seen.seq)) {
+        this.rooms[data.room] = { epoch: data.epoch, seq: data.seq };
+      }
+    });
+    // Every (re)connect rejoins the rooms and asks only for what was missed
+    this.socket.on('connect', () => {
+      if (Object.keys(this.rooms).length) {
+        this.socket.emit('resync', { rooms: this.rooms });
+      }
+    });
+    this.socket.on('replay', (replay) => {
+      this.rooms[replay.room] = { epoch: replay.epoch, seq: replay.seq };
+      if (replay.snapshot_required) {
+        // Too much was missed; listeners reload the room's state over REST
+        this.dispatch('resync_snapshot', { room: replay.room });
+        return;
+      }
+      replay.events.forEach(({ event, data }) => this.dispatch(event, data));
+    });
+    // Not a member (any more): stop asking for the room on reconnect
+    this.socket.on('room_error', ({ room }) => this.unsubscribe(room));
     return this.socket;
   }
 
+  dispatch(event, data) {
+    this.socket.listeners(event).forEach((listener) => listener(data));
+  }
+
+  subscribe(room) {
+    if (!this.rooms[room]) {
+      this.rooms[room] = { epoch: null, seq: null };
+    }
+    if (this.socket) {
+      this.socket.emit('resync', { rooms: { [room]: this.rooms[room] } });
+    }
+  }
+
+  unsubscribe(room) {
+    delete this.rooms[room];
+    // Leave the server-side room too, or its broadcasts keep arriving
+    if (this.socket) {
+      this.socket.emit('unsubscribe', { room });
+    }
+  }
+
   disconnect() {
     if (this.socket) {
       this.socket.disconnect();
@@ -19,15 +67,14 @@ class SocketService {
   }
 
   joinGroup(groupId) {
+    this.rooms[`group_${groupId}`] = this.rooms[`group_${groupId}`] || { epoch: null, seq: null };
     if (this.socket) {
       this.socket.emit('join_group', { group_id: groupId });
     }
   }
 
   leaveGroup(groupId) {
-    if (this.socket) {
-      this.socket.emit('leave_group', { group_id: groupId });
-    }
+    this.unsubscribe(`group_${groupId}`);
   }
 
   createEvent(groupId, eventData) {
@@ -39,21 +86,22 @@ class SocketService {
     }
   }
 
-  castVote(pollId, optionId, userId) {
+  castVote(pollId, optionId) {
+    // The server votes as the user this socket authenticated with
     if (this.socket) {
       this.socket.emit('cast_vote', {
         poll_id: pollId,
-        option_id: optionId,
-        user_id: userId
+        option_id: optionId
       });
     }
   }
 
-  sendMessage(groupId, message) {
+  sendMessage(groupId, message, clientId) {
     if (this.socket) {
       this.socket.emit('send_message', {
         group_id: groupId,
-        message: message
+        message: message,
+        client_id: clientId
       });
     }
   }